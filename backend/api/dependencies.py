@@ -0,0 +1,84 @@
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import HTTPException
+from models import Product
+from ml_service import ml_service
+from inference_pool import inference_pool
+
+# Seconds clients should wait before retrying while the ML Service warms up
+WARMUP_RETRY_AFTER = "5"
+# Seconds clients should back off when the inference pool is saturated
+SATURATED_RETRY_AFTER = "1"
+
+
+def _warming_up(detail: str) -> HTTPException:
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": WARMUP_RETRY_AFTER})
+
+
+async def require_ml_ready():
+    """Image search needs both the model and the embedding cache."""
+    if not ml_service.is_ready:
+        raise _warming_up("Visual search is warming up, please retry shortly")
+
+
+async def require_cache_ready():
+    """Recommendations only need the embedding cache."""
+    if not ml_service.cache_ready:
+        raise _warming_up("Recommendations are warming up, please retry shortly")
+
+
+@asynccontextmanager
+async def inference_admission():
+    """
+    Admits one request into the bounded inference pool for the duration of
+    the block, or rejects it with 429 when the pool is saturated.
+    """
+    if not inference_pool.try_acquire():
+        raise HTTPException(status_code=429, detail="Visual search is busy, please retry shortly",
+                            headers={"Retry-After": SATURATED_RETRY_AFTER})
+    try:
+        yield
+    finally:
+        inference_pool.release()
+
+
+async def inference_slot():
+    """inference_admission() for the duration of the endpoint."""
+    async with inference_admission():
+        yield
+
+
+class ProductFilters:
+    """
+    Optional catalog filters (query parameters) for similarity searches. The
+    in-memory index applies them through per-attribute bitmaps before the
+    top-k selection (as_dict); SQL paths use conditions().
+    """
+
+    def __init__(self, category_id: Optional[int] = None, gender: Optional[str] = None,
+                 sub_category: Optional[str] = None, min_price: Optional[float] = None,
+                 max_price: Optional[float] = None):
+        self.category_id = category_id
+        self.gender = gender
+        self.sub_category = sub_category
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def as_dict(self) -> dict:
+        """The filters that are set, as accepted by ml_service.find_similar_products."""
+        return {key: value for key, value in vars(self).items() if value}
+
+    def conditions(self) -> list:
+        """SQLAlchemy WHERE clauses on Product (indexed attribute columns)."""
+        conditions = []
+        if self.category_id:
+            conditions.append(Product.category_id == self.category_id)
+        if self.gender:
+            conditions.append(Product.gender == self.gender.lower())
+        if self.sub_category:
+            conditions.append(Product.article_type == self.sub_category.lower())
+        if self.min_price:
+            conditions.append(Product.price >= self.min_price)
+        if self.max_price:
+            conditions.append(Product.price <= self.max_price)
+        return conditions
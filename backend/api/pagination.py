@@ -0,0 +1,90 @@
+import json
+import base64
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlmodel import and_, or_
+from models import Product
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Sort columns paginated by keyset (sort value, id); other orderings fall back to offset cursors
+KEYSET_COLUMNS = {"created_at", "price", "rating", "name", "id"}
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, order: str) -> dict:
+    """Decodes an opaque cursor, rejecting malformed ones and cursors issued for another ordering."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(state, dict):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if state.get("sort") != sort_by or state.get("order") != order:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+    return state
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _sql_value(sort_by: str, value):
+    return datetime.fromisoformat(value) if sort_by == "created_at" and value is not None else value
+
+
+def _nullable(sort_by: str) -> bool:
+    column = Product.__table__.c.get(sort_by)
+    return column is not None and column.nullable
+
+
+def sort_order(sort_by: str, order: str) -> tuple:
+    """
+    ORDER BY clauses for (sort column, id). NULLs of a nullable column sort
+    last in both directions, where keyset_condition expects them; NOT NULL
+    columns keep the plain order their index serves.
+    """
+    column = getattr(Product, sort_by)
+    key, tie = (column.desc(), Product.id.desc()) if order == "desc" else (column.asc(), Product.id.asc())
+    return (key.nulls_last(), tie) if _nullable(sort_by) else (key, tie)
+
+
+def keyset_condition(sort_by: str, order: str, state: dict):
+    """Rows strictly after the cursor in sort_order; served by the sort column's index."""
+    column = getattr(Product, sort_by)
+    value, last_id = _sql_value(sort_by, state.get("value")), state.get("id")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    after_id = Product.id < last_id if order == "desc" else Product.id > last_id
+    if sort_by == "id":
+        return after_id
+    if value is None:
+        # Past the last non-NULL value: only the trailing NULLs remain, ordered by id
+        return and_(column == None, after_id)
+    after_value = column < value if order == "desc" else column > value
+    if _nullable(sort_by):
+        return or_(after_value, and_(column == value, after_id), column == None)
+    return or_(after_value, and_(column == value, after_id))
+
+
+def next_cursor(sort_by: str, order: str, page: list, limit: int, offset: Optional[int] = None) -> Optional[str]:
+    """
+    Cursor for the page after `page`, or None when it was the last one. With
+    offset=None the cursor is a keyset position (last row's sort value and id),
+    otherwise the offset of the next page (relevance ranking, unindexed sorts).
+    """
+    if len(page) < limit:
+        return None
+    state = {"sort": sort_by, "order": order}
+    if offset is not None:
+        state["offset"] = offset + len(page)
+    else:
+        last = page[-1]
+        state["value"] = _json_value(getattr(last, sort_by))
+        state["id"] = last.id
+    return encode_cursor(state)
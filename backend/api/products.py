@@ -1,65 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlmodel import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from typing import List, Optional
-from models import Product, ProductBase, Category, CategoryBase
+from models import Product, ProductRead, ProductDetail, Category, CategoryBase
 from database import get_session
 from ml_service import ml_service
+from api.dependencies import require_cache_ready, inference_admission, ProductFilters
+from api.pagination import KEYSET_COLUMNS, NEXT_CURSOR_HEADER, decode_cursor, keyset_condition, next_cursor, sort_order
+from api.projection import selected_fields, list_columns, listed, project
+from response_cache import response_cache
+from inference_pool import inference_pool
+import pgvector_backend
+import text_search
 
 router = APIRouter(prefix="/products", tags=["products"])
 
-@router.get("/", response_model=List[Product])
+@router.get("/", response_model=List[ProductRead])
 async def get_products(
+    response: Response,
     offset: int = 0,
     limit: int = Query(default=20, le=100),
     category_id: Optional[int] = None,
     gender: Optional[str] = None,
     sub_category: Optional[str] = None,
+    base_colour: Optional[str] = None,
+    season: Optional[str] = None,
+    usage: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    sort_by: Optional[str] = "created_at",
+    sort_by: Optional[str] = None,
     order: Optional[str] = "desc",
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = Depends(selected_fields),
     session: AsyncSession = Depends(get_session)
 ):
+    """
+    Paginates either by offset or by the opaque cursor returned in the
+    X-Next-Cursor header of the previous page. Cursors over created_at,
+    price, rating, name and id are keyset positions, so deep pages cost the
+    same as the first one. `fields=` trims each product to the named
+    fields; the embedding is never loaded.
+    """
     query = select(Product)
     
+    # Full-text index (FTS5 / tsvector): ranked, prefix-matching, no leading-wildcard scan
+    relevance = None
     if search:
-        query = query.where(Product.name.ilike(f"%{search}%") | Product.description.ilike(f"%{search}%"))
+        query, relevance = text_search.apply(query, search, session.bind.dialect.name)
     if category_id:
         query = query.where(Product.category_id == category_id)
     
-    # Modern JSON attribute filtering for SQLite/Generic JSON
+    # Attribute filters hit the indexed, lower-cased columns materialized from `attributes`
     if gender:
-        # Case-insensitive filtering using json_extract and lower
-        query = query.where(func.lower(func.json_extract(Product.attributes, "$.gender")) == gender.lower())
+        query = query.where(Product.gender == gender.lower())
     if sub_category:
-        query = query.where(func.lower(func.json_extract(Product.attributes, "$.articleType")) == sub_category.lower())
+        # sub_category is the articleType (e.g. "Tshirts"), as the shop page uses it
+        query = query.where(Product.article_type == sub_category.lower())
+    if base_colour:
+        query = query.where(Product.base_colour == base_colour.lower())
+    if season:
+        query = query.where(Product.season == season.lower())
+    if usage:
+        query = query.where(Product.usage == usage.lower())
 
     if min_price:
         query = query.where(Product.price >= min_price)
     if max_price:
         query = query.where(Product.price <= max_price)
         
-    # Ordering logic
-    if order == "desc":
-        query = query.order_by(getattr(Product, sort_by).desc())
+    # Ordering logic: searches rank by relevance unless another order is requested.
+    # id breaks ties, so every page boundary is well defined.
+    order = "desc" if order == "desc" else "asc"
+    if relevance is not None and sort_by in (None, "relevance"):
+        sort_by = "relevance"
+        query = query.order_by(relevance, Product.id)
     else:
-        query = query.order_by(getattr(Product, sort_by).asc())
+        sort_by = sort_by if sort_by not in (None, "relevance") else "created_at"
+        query = query.order_by(*sort_order(sort_by, order))
+
+    keyset = sort_by in KEYSET_COLUMNS
+    if cursor:
+        state = decode_cursor(cursor, sort_by, order)
+        if keyset:
+            query = query.where(keyset_condition(sort_by, order, state))
+            offset = 0
+        else:
+            offset = state.get("offset")
+            if not isinstance(offset, int) or offset < 0:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
         
+    # The sort column is loaded even when not selected: the next cursor is built from it
+    query = query.options(list_columns(fields, extra=(sort_by,) if keyset else ()))
     query = query.offset(offset).limit(limit)
     
     results = await session.execute(query)
-    return results.scalars().all()
+    products = results.scalars().all()
 
+    next_page = next_cursor(sort_by, order, products, limit, offset=None if keyset else offset)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
+    return project(products, fields, headers={NEXT_CURSOR_HEADER: next_page} if next_page else None)
 
-@router.get("/featured", response_model=List[Product])
+
+@router.get("/featured", response_model=List[ProductRead])
 async def get_featured_products(
+    request: Request,
     limit: int = Query(default=8, le=20),
+    fields: Optional[List[str]] = Depends(selected_fields),
     session: AsyncSession = Depends(get_session)
 ):
+    # Homepage sections are served from the response cache; see response_cache.py
+    cached = response_cache.get(request)
+    if cached is not None:
+        return cached
+
     # Try to get explicitly marked featured products first
-    query = select(Product).where(Product.is_featured == True).limit(limit)
+    query = select(Product).options(list_columns(fields)).where(Product.is_featured == True).limit(limit)
     results = await session.execute(query)
     products = results.scalars().all()
     
@@ -67,45 +125,61 @@ async def get_featured_products(
     if len(products) < limit:
         remaining = limit - len(products)
         # Using func.random() for SQLite
-        query_rand = select(Product).order_by(func.random()).limit(remaining)
+        query_rand = select(Product).options(list_columns(fields)).order_by(func.random()).limit(remaining)
         rand_results = await session.execute(query_rand)
         products.extend(rand_results.scalars().all())
         
-    return products
+    return response_cache.put(request, listed(products, fields))
 
-@router.get("/popular", response_model=List[Product])
+@router.get("/popular", response_model=List[ProductRead])
 async def get_popular_products(
+    request: Request,
     limit: int = Query(default=8, le=20),
+    fields: Optional[List[str]] = Depends(selected_fields),
     session: AsyncSession = Depends(get_session)
 ):
+    cached = response_cache.get(request)
+    if cached is not None:
+        return cached
+
     # Try to get explicitly marked popular products
-    query = select(Product).where(Product.is_popular == True).limit(limit)
+    query = select(Product).options(list_columns(fields)).where(Product.is_popular == True).limit(limit)
     results = await session.execute(query)
     products = results.scalars().all()
     
     if len(products) < limit:
         remaining = limit - len(products)
-        query_rand = select(Product).order_by(func.random()).limit(remaining)
+        query_rand = select(Product).options(list_columns(fields)).order_by(func.random()).limit(remaining)
         rand_results = await session.execute(query_rand)
         products.extend(rand_results.scalars().all())
         
-    return products
+    return response_cache.put(request, listed(products, fields))
 
-@router.get("/new-arrivals", response_model=List[Product])
+@router.get("/new-arrivals", response_model=List[ProductRead])
 async def get_new_products(
+    request: Request,
     limit: int = Query(default=8, le=20),
+    fields: Optional[List[str]] = Depends(selected_fields),
     session: AsyncSession = Depends(get_session)
 ):
-    query = select(Product).order_by(Product.created_at.desc()).limit(limit)
+    cached = response_cache.get(request)
+    if cached is not None:
+        return cached
+
+    query = select(Product).options(list_columns(fields)).order_by(Product.created_at.desc()).limit(limit)
     results = await session.execute(query)
-    return results.scalars().all()
+    return response_cache.put(request, listed(results.scalars().all(), fields))
 
 
 class CategoryRead(CategoryBase):
     id: int
 
 @router.get("/categories", response_model=List[CategoryRead])
-async def get_categories(session: AsyncSession = Depends(get_session)):
+async def get_categories(request: Request, session: AsyncSession = Depends(get_session)):
+    cached = response_cache.get(request)
+    if cached is not None:
+        return cached
+
     results = await session.execute(select(Category))
     categories = results.scalars().all()
     
@@ -115,56 +189,76 @@ async def get_categories(session: AsyncSession = Depends(get_session)):
         cat_data = cat.dict()
         if not cat_data.get("image_url"):
             # Get first product image from this category
-            prod_query = select(Product).where(Product.category_id == cat.id).limit(1)
+            prod_query = select(Product.image_urls).where(Product.category_id == cat.id).limit(1)
             prod_res = await session.execute(prod_query)
-            prod = prod_res.scalar_one_or_none()
-            if prod and prod.image_urls:
-                cat_data["image_url"] = prod.image_urls[0]
+            image_urls = prod_res.scalar_one_or_none()
+            if image_urls:
+                cat_data["image_url"] = image_urls[0]
         processed_categories.append(cat_data)
         
-    return processed_categories
+    return response_cache.put(request, processed_categories)
 
-@router.get("/{product_id}", response_model=Product)
+@router.get("/{product_id}", response_model=ProductDetail)
 async def get_product(product_id: int, session: AsyncSession = Depends(get_session)):
-    product = await session.get(Product, product_id)
+    product = await session.get(Product, product_id, options=[list_columns(extra=("updated_at",))])
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
-@router.get("/{product_id}/recommendations", response_model=List[Product])
+async def _fetch_in_order(session: AsyncSession, ids: List[int], fields: Optional[List[str]] = None) -> List[Product]:
+    """Listed products for ids, in the given (similarity) order."""
+    full_prod_res = await session.execute(select(Product).options(list_columns(fields)).where(Product.id.in_(ids)))
+    products_map = {p.id: p for p in full_prod_res.scalars().all()}
+    return [products_map[pid] for pid in ids if pid in products_map]
+
+@router.get("/{product_id}/recommendations", response_model=List[ProductRead])
 async def get_product_recommendations(
     product_id: int, 
     limit: int = Query(default=6, le=20),
+    filters: ProductFilters = Depends(),
+    fields: Optional[List[str]] = Depends(selected_fields),
     session: AsyncSession = Depends(get_session)
 ):
-    # 1. Get the source product
-    product = await session.get(Product, product_id)
-    if not product or not product.embedding:
-        # Fallback to random products if no embedding or product not found
-        query_rand = select(Product).where(Product.id != product_id).order_by(func.random()).limit(limit)
+    # 1. Serve precomputed neighbours when the offline table covers this product:
+    # a single primary-key lookup instead of a catalog scan. The table is unfiltered.
+    neighbour_ids = ml_service.recommend(product_id, limit) if not filters.as_dict() else None
+    if neighbour_ids is not None:
+        return project(await _fetch_in_order(session, neighbour_ids, fields), fields)
+
+    # 2. With pgvector the source product's stored vector is the query, so its
+    # embedding never leaves the database
+    if pgvector_backend.ACTIVE:
+        await require_cache_ready()
+        similar_results = await pgvector_backend.search_similar(
+            session, ml_service.model_id, source_id=product_id, k=limit, conditions=filters.conditions())
+        if similar_results:
+            return project(await _fetch_in_order(session, [pid for pid, _ in similar_results], fields), fields)
+        query_rand = select(Product).options(list_columns(fields)).where(
+            Product.id != product_id, *filters.conditions()).order_by(func.random()).limit(limit)
+        results = await session.execute(query_rand)
+        return project(results.scalars().all(), fields)
+
+    # 3. Otherwise get the source product; its embedding is the query
+    product = await session.get(Product, product_id, options=[load_only(Product.embedding, Product.embedding_model)])
+    if not product or not product.embedding or product.embedding_model != ml_service.model_id:
+        # Fallback to random products if no (comparable) embedding or product not found
+        query_rand = select(Product).options(list_columns(fields)).where(
+            Product.id != product_id, *filters.conditions()).order_by(func.random()).limit(limit)
         results = await session.execute(query_rand)
-        return results.scalars().all()
+        return project(results.scalars().all(), fields)
 
-    # 2. Find similar products using ML service
-    # We use the in-memory cache populated on startup (sub-second performance)
-    similar_results = ml_service. find_similar_products(product.embedding, products_data=None, k=limit + 1)
+    # 4. Find similar products using ML service
+    # We use the in-memory cache populated on startup, searched on the inference pool.
+    # Only this path takes a pool slot; table lookups stay available when visual search saturates it.
+    await require_cache_ready()
+    async with inference_admission():
+        similar_results = await inference_pool.run(ml_service.find_similar_products, product.embedding,
+                                                   products_data=None, k=limit + 1, filters=filters.as_dict())
     
-    # 3. Filter out the current product and fetch full objects
+    # 5. Filter out the current product and fetch the listed columns
     similar_ids = [res[0] for res in similar_results if res[0] != product_id][:limit]
     
     if not similar_ids:
         return []
 
-    prod_query = select(Product).where(Product.id.in_(similar_ids))
-    full_prod_res = await session.execute(prod_query)
-    full_products = full_prod_res.scalars().all()
-    
-    # Preserve order of similarity
-    products_map = {p.id: p for p in full_products}
-    recommended_products = []
-    
-    for sid, score in similar_results:
-        if sid in products_map:
-            recommended_products.append(products_map[sid])
-
-    return recommended_products
+    return project(await _fetch_in_order(session, similar_ids, fields), fields)
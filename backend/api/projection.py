@@ -0,0 +1,45 @@
+from typing import List, Optional, Sequence
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import load_only
+from models import Product, ProductRead
+
+# Columns a listing may return; the embedding (and other internal columns) never are
+LIST_FIELDS = tuple(ProductRead.model_fields)
+
+
+def selected_fields(
+    fields: Optional[str] = Query(None, description="Comma-separated subset of product fields, e.g. id,name,price,image_urls")
+) -> Optional[List[str]]:
+    """Parses the opt-in `fields=` selector. id is always included; unknown names are a 400."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+
+
+def list_columns(fields: Optional[Sequence[str]] = None, extra: Sequence[str] = ()):
+    """load_only() option selecting just the listed columns (default: every LIST_FIELDS column)."""
+    names = dict.fromkeys([*(fields or LIST_FIELDS), *extra])
+    return load_only(*(getattr(Product, name) for name in names))
+
+
+def listed(products: Sequence[Product], fields: Optional[List[str]] = None) -> List[dict]:
+    """Products as plain dicts of the selected fields (default: every LIST_FIELDS field)."""
+    names = fields or LIST_FIELDS
+    return [{name: getattr(p, name) for name in names} for p in products]
+
+
+def project(products: Sequence[Product], fields: Optional[List[str]], headers: Optional[dict] = None):
+    """
+    Products as returned by a listing endpoint: unchanged (serialized through
+    the endpoint's response_model) without a selector, otherwise a JSON
+    response holding only the selected fields.
+    """
+    if fields is None:
+        return products
+    return JSONResponse(jsonable_encoder(listed(products, fields)), headers=headers)
@@ -1,34 +1,78 @@
-
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from typing import List
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import Product, ProductBase
+from models import Product, ProductRead
 from database import get_session
 from ml_service import ml_service
+from api.dependencies import require_ml_ready, inference_slot, ProductFilters
+from api.projection import list_columns
+from inference_pool import inference_pool
+from query_cache import query_cache, CachedQuery, perceptual_hash
+from image_embedding_cache import image_embedding_cache, content_digest
+import pgvector_backend
 
 router = APIRouter(prefix="/search", tags=["search"])
 
 
-class ProductWithScore(ProductBase):
-    id: int
-    category_id: int
+class ProductWithScore(ProductRead):
     match_score: float
 
-@router.post("/image", response_model=List[ProductWithScore])
-async def search_by_image(file: UploadFile = File(...), session: AsyncSession = Depends(get_session)):
+@router.post("/image", response_model=List[ProductWithScore], dependencies=[Depends(require_ml_ready), Depends(inference_slot)])
+async def search_by_image(file: UploadFile = File(...), filters: ProductFilters = Depends(),
+                          session: AsyncSession = Depends(get_session)):
     # 1. Read the image file
     contents = await file.read()
-    
-    # 2. Extract features
-    query_embedding = ml_service.extract_features_from_bytes(contents)
-    
-    if not query_embedding:
-        raise HTTPException(status_code=400, detail="Could not process image")
+
+    # 2. Reuse the embedding of an identical (or, with ML_QUERY_CACHE_PHASH, a
+    # visually identical) upload instead of decoding and running the model again.
+    # Memory first, then the persistent image embedding cache filled by the embedding
+    # scripts (catalog images). Uploads are only remembered in the bounded memory tier,
+    # so anonymous clients cannot grow the shared store on disk.
+    digest = content_digest(contents)
+    cached = query_cache.lookup(digest)
+    if cached is None:
+        stored = await inference_pool.run(image_embedding_cache.get, digest, ml_service.model_id)
+        if stored is not None:
+            cached = CachedQuery(stored, None, -1)
+            query_cache.store_persistent_hit(digest, cached)
+    if cached is None:
+        # Decoding and search run on the inference pool and the forward pass is
+        # coalesced with concurrent uploads, so the event loop stays free.
+        try:
+            img = await inference_pool.run(ml_service.load_image, contents)
+        except Exception as e:
+            print(f"Error decoding uploaded image: {e}")
+            raise HTTPException(status_code=400, detail="Could not process image")
+        phash = await inference_pool.run(perceptual_hash, img) if query_cache.perceptual else None
+        cached = query_cache.lookup_perceptual(phash)
+        if cached is not None:
+            query_cache.alias(digest, cached)
+        else:
+            query_embedding = await asyncio.wrap_future(ml_service.submit_features(img))
+            cached = CachedQuery(query_embedding, None, -1)
+            query_cache.store(digest, phash, cached)
 
     # 3. Find similar products (returns tuples of id, score)
-    # We use the in-memory cache populated on startup for sub-second performance.
-    similar_results = ml_service.find_similar_products(query_embedding, products_data=None, k=24)
+    conditions = filters.conditions()
+    if pgvector_backend.ACTIVE:
+        # Top-k (with the filters) runs inside Postgres over its ANN index
+        similar_results = await pgvector_backend.search_similar(
+            session, ml_service.model_id, query_embedding=cached.embedding, k=24, conditions=conditions)
+    elif filters.as_dict():
+        # Filters select the matching rows of the in-memory index before ranking
+        similar_results = await inference_pool.run(ml_service.find_similar_products, cached.embedding,
+                                                   products_data=None, k=24, filters=filters.as_dict())
+    else:
+        # We use the in-memory cache populated on startup for sub-second performance.
+        # Cached (unfiltered) results stay valid until the index changes.
+        index_version = ml_service.index_version
+        if cached.index_version == index_version:
+            similar_results = cached.results
+        else:
+            similar_results = await inference_pool.run(ml_service.find_similar_products, cached.embedding, products_data=None, k=24)
+            cached.results, cached.index_version = similar_results, index_version
     
     if not similar_results:
         return []
@@ -36,8 +80,9 @@ async def search_by_image(file: UploadFile = File(...), session: AsyncSession =
     similar_ids = [r[0] for r in similar_results]
     scores_map = {r[0]: r[1] for r in similar_results}
         
-    # 5. Fetch full product objects ONLY for the similar IDs
-    prod_query = select(Product).where(Product.id.in_(similar_ids))
+    # 5. Fetch the listed columns ONLY for the similar IDs (never the embedding)
+    # Filters are re-checked against the live rows (the index's attributes trail by one delta poll)
+    prod_query = select(Product).options(list_columns()).where(Product.id.in_(similar_ids), *conditions)
     full_prod_res = await session.execute(prod_query)
     full_products = full_prod_res.scalars().all()
     
@@ -48,7 +93,7 @@ async def search_by_image(file: UploadFile = File(...), session: AsyncSession =
     for pid, score in similar_results:
         if pid in products_map:
             prod = products_map[pid]
-            prod_dict = prod.dict()
+            prod_dict = prod.model_dump(include=set(ProductRead.model_fields))
             prod_dict['match_score'] = score
             recommended_products.append(ProductWithScore(**prod_dict))
             
@@ -0,0 +1,139 @@
+import threading
+import numpy as np
+from typing import Dict, Iterable, Optional, Tuple
+
+# Categorical filters: query parameter (same names as /products) -> materialized Product column
+CATEGORICAL_FILTERS = {"gender": "gender", "sub_category": "article_type"}
+
+
+class AlignedAttributes:
+    """
+    Catalog attributes gathered into the row order of one index (index.ids).
+    Boolean bitmaps for categorical values are built on first use and reused
+    by every later search against the same index.
+    """
+
+    def __init__(self, ids: np.ndarray, category: np.ndarray, price: np.ndarray, codes: Dict[str, np.ndarray]):
+        self.ids = ids
+        self.category = category
+        self.price = price
+        self.codes = codes
+        self._bitmaps: Dict[Tuple[str, int], np.ndarray] = {}
+
+    def bitmap(self, name: str, code: int) -> np.ndarray:
+        key = (name, code)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            source = self.category if name == "category_id" else self.codes[name]
+            bitmap = source == code
+            self._bitmaps[key] = bitmap
+        return bitmap
+
+
+class CatalogAttributes:
+    """
+    Filterable product attributes (category, price, gender, articleType) held
+    in dense arrays indexed by product id. Categorical values are lower-cased
+    and dictionary-encoded (code 0 = missing). Searches ask for a boolean
+    mask aligned with the index rows, so filtering happens before scoring.
+    The arrays grow geometrically and updates write into them in place;
+    searches read the aligned copy, which is rebuilt after every update.
+    """
+
+    def __init__(self):
+        self.category = np.zeros(0, dtype=np.int32)
+        # NaN = unknown price
+        self.price = np.zeros(0, dtype=np.float32)
+        self.codes = {name: np.zeros(0, dtype=np.int32) for name in CATEGORICAL_FILTERS}
+        self.vocab: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORICAL_FILTERS}
+        self._lock = threading.Lock()
+        self._aligned: Optional[AlignedAttributes] = None
+        # Odd while an update is writing; an aligned copy built across an update is not cached
+        self._version = 0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.category))
+
+    def _encode(self, name: str, value) -> int:
+        if not value:
+            return 0
+        vocab = self.vocab[name]
+        return vocab.setdefault(str(value).lower(), len(vocab) + 1)
+
+    def update(self, rows: Iterable[tuple]):
+        """
+        rows: (product_id, category_id, price, gender, articleType) tuples,
+        e.g. straight from the warm-up query or a delta poll.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            needed = int(ids.max()) + 1
+            if needed > len(self.category):
+                size = max(needed, 2 * len(self.category))
+                self.category = _grown(self.category, size, 0)
+                self.price = _grown(self.price, size, np.nan)
+                self.codes = {name: _grown(array, size, 0) for name, array in self.codes.items()}
+            self._version += 1
+            self.category[ids] = [r[1] or 0 for r in rows]
+            self.price[ids] = [np.nan if r[2] is None else r[2] for r in rows]
+            for offset, name in enumerate(CATEGORICAL_FILTERS, start=3):
+                self.codes[name][ids] = [self._encode(name, r[offset]) for r in rows]
+            self._version += 1
+            self._aligned = None
+
+    def aligned(self, ids: np.ndarray) -> AlignedAttributes:
+        """Attributes in the row order of `ids`; cached until the index or the attributes change."""
+        aligned = self._aligned
+        # Index mutations replace index.ids, so identity tells whether the rows moved
+        if aligned is not None and aligned.ids is ids:
+            return aligned
+        version = self._version
+        category, price, codes = self.category, self.price, self.codes
+        # Products unknown to the attribute table match no filter
+        known = ids < len(category)
+        rows = np.where(known, ids, 0)
+        aligned = AlignedAttributes(
+            ids,
+            np.where(known, category[rows], 0) if len(category) else np.zeros(len(ids), dtype=np.int32),
+            np.where(known, price[rows], np.nan) if len(price) else np.full(len(ids), np.nan, dtype=np.float32),
+            {name: np.where(known, array[rows], 0) if len(array) else np.zeros(len(ids), dtype=np.int32)
+             for name, array in codes.items()},
+        )
+        if version == self._version and not version % 2:
+            self._aligned = aligned
+        return aligned
+
+    def mask(self, ids: np.ndarray, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        Boolean mask over the index rows `ids` of the products matching every
+        filter (category_id, gender, sub_category, min_price, max_price),
+        or None when no filter is set.
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        if not filters:
+            return None
+        aligned = self.aligned(ids)
+        mask = np.ones(len(ids), dtype=bool)
+        if "category_id" in filters:
+            mask &= aligned.bitmap("category_id", int(filters["category_id"]))
+        for name in CATEGORICAL_FILTERS:
+            if name in filters:
+                code = self.vocab[name].get(str(filters[name]).lower())
+                if code is None:
+                    return np.zeros(len(ids), dtype=bool)
+                mask &= aligned.bitmap(name, code)
+        # NaN prices compare False, so unknown prices never match a price range
+        if "min_price" in filters:
+            mask &= aligned.price >= filters["min_price"]
+        if "max_price" in filters:
+            mask &= aligned.price <= filters["max_price"]
+        return mask
+
+
+def _grown(array: np.ndarray, size: int, fill) -> np.ndarray:
+    grown = np.full(size, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
@@ -0,0 +1,63 @@
+import os
+import torch.nn as nn
+import torchvision.models as models
+import torchvision.transforms as transforms
+from typing import Callable
+from preprocess import IMAGENET_MEAN, IMAGENET_STD
+
+# Backbone Configuration - Configurable via .env
+# ML_BACKBONE: "resnet50" (default), "resnet18", "mobilenet_v3_large", "mobilenet_v3_small" or "efficientnet_b0".
+# Changing it invalidates stored embeddings; re-run generate_embeddings.py afterwards.
+BACKBONE_NAME = os.getenv("ML_BACKBONE", "resnet50")
+
+
+class Backbone:
+    """
+    A torchvision classifier used as a feature extractor: the classification
+    head is replaced by Identity so the network returns its pooled features.
+    """
+
+    def __init__(self, name: str, factory: Callable, weights: str, dim: int, head: str, input_size: int = 224):
+        self.name = name
+        self.factory = factory
+        self.weights = weights
+        self.dim = dim
+        self.head = head
+        self.input_size = input_size
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the embedding space: architecture, weights and input transform."""
+        return f"{self.name}:{self.weights}:{self.input_size}"
+
+    def build(self, device) -> nn.Module:
+        print(f"Loading {self.name} model on {device}...")
+        model = self.factory(weights=self.weights)
+        # Remove the classification head; forward() then ends at global average pooling
+        setattr(model, self.head, nn.Identity())
+        model.to(device)
+        model.eval()
+        print("Model loaded successfully.")
+        return model
+
+    def transform(self) -> transforms.Compose:
+        return transforms.Compose([
+            transforms.Resize((self.input_size, self.input_size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=IMAGENET_MEAN.tolist(), std=IMAGENET_STD.tolist()),
+        ])
+
+
+BACKBONES = {
+    "resnet50": Backbone("resnet50", models.resnet50, "IMAGENET1K_V1", 2048, "fc"),
+    "resnet18": Backbone("resnet18", models.resnet18, "IMAGENET1K_V1", 512, "fc"),
+    "mobilenet_v3_large": Backbone("mobilenet_v3_large", models.mobilenet_v3_large, "IMAGENET1K_V2", 960, "classifier"),
+    "mobilenet_v3_small": Backbone("mobilenet_v3_small", models.mobilenet_v3_small, "IMAGENET1K_V1", 576, "classifier"),
+    "efficientnet_b0": Backbone("efficientnet_b0", models.efficientnet_b0, "IMAGENET1K_V1", 1280, "classifier"),
+}
+
+
+def get_backbone(name: str = BACKBONE_NAME) -> Backbone:
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown ML_BACKBONE '{name}'. Choose from: {', '.join(BACKBONES)}")
+    return BACKBONES[name]
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from backbones import BACKBONES, get_backbone
+from inference_backend import InferenceEngine, configure_threads
+from vector_index import ExactIndex, normalize_rows
+
+# Configuration
+DB_PATH = "fashion_fiesta.db"
+DATASET_PATH = r"C:\Users\Lenovo\.cache\kagglehub\datasets\paramaggarwal\fashion-product-images-dataset\versions\1\fashion-dataset"
+IMAGES_DIR = os.path.join(DATASET_PATH, "images")
+
+
+def load_catalog_sample(db_path: str, images_dir: str, limit: int):
+    """(image paths, articleType labels) for up to `limit` products whose image exists locally."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT image_urls, attributes FROM product ORDER BY id")
+    paths, labels = [], []
+    for img_urls_json, attrs_json in cursor:
+        img_urls = json.loads(img_urls_json or "[]")
+        if not img_urls:
+            continue
+        path = os.path.join(images_dir, img_urls[0].split('/')[-1])
+        if os.path.exists(path):
+            paths.append(path)
+            labels.append(json.loads(attrs_json or "{}").get("articleType"))
+        if len(paths) >= limit:
+            break
+    conn.close()
+    return paths, np.array(labels, dtype=object)
+
+
+def embed(engine: InferenceEngine, transform, paths, batch_size: int):
+    """Embeds every image; returns (normalized vectors, images/sec including preprocessing)."""
+    chunks = []
+    start = time.perf_counter()
+    for i in range(0, len(paths), batch_size):
+        tensors = []
+        for path in paths[i:i + batch_size]:
+            with Image.open(path) as img:
+                tensors.append(transform(img.convert('RGB')))
+        chunks.append(engine(torch.stack(tensors)).numpy())
+    elapsed = time.perf_counter() - start
+    return normalize_rows(np.concatenate(chunks)), len(paths) / elapsed
+
+
+def neighbours(vectors: np.ndarray, k: int) -> np.ndarray:
+    """Leave-one-out top-k positions for every catalog item."""
+    index = ExactIndex()
+    index.build(np.arange(len(vectors)), vectors)
+    return np.stack([index.search(v, k + 1)[0][1:k + 1] for v in vectors])
+
+
+def benchmark(db_path: str, images_dir: str, names, limit: int, batch_size: int, k: int):
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}")
+        return
+    paths, labels = load_catalog_sample(db_path, images_dir, limit)
+    if len(paths) <= k:
+        print(f"Need more than {k} catalog images in {images_dir}, found {len(paths)}.")
+        return
+    print(f"Benchmarking on {len(paths)} catalog images (batch {batch_size}, {torch.get_num_threads()} threads).")
+
+    device = torch.device("cpu")
+    baseline = None
+    for name in names:
+        backbone = get_backbone(name)
+        model = backbone.build(device)
+        params = sum(p.numel() for p in model.parameters())
+        weights_mb = sum(p.numel() * p.element_size() for p in model.parameters()) / 1e6
+        vectors, throughput = embed(InferenceEngine(model, name, device), backbone.transform(), paths, batch_size)
+
+        nn = neighbours(vectors, k)
+        # Share of neighbours with the same articleType: retrieval quality without hand labels
+        precision = float(np.mean(labels[nn] == labels[:, None]))
+        line = (f"{name:<20} dim={backbone.dim:<5} params={params / 1e6:5.1f}M  weights={weights_mb:6.1f} MB  "
+                f"{throughput:6.1f} img/s  precision@{k}: {precision:.3f}")
+        if baseline is None:
+            baseline = nn
+        else:
+            # Overlap with the first backbone's neighbour lists (ResNet50 by default)
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(nn, baseline)])
+            line += f"  recall@{k} vs {names[0]}: {overlap:.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare backbone throughput, memory and retrieval quality on catalog images.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--images", default=IMAGES_DIR)
+    parser.add_argument("--backbones", nargs="+", default=list(BACKBONES), choices=list(BACKBONES),
+                        help="The first one is the reference for neighbour recall")
+    parser.add_argument("--limit", type=int, default=1000, help="Catalog images to embed")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    configure_threads()
+    benchmark(args.db, args.images, args.backbones, args.limit, args.batch_size, args.k)
@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import numpy as np
+from typing import Optional, Tuple
+from sqlmodel import select, func, cast, String, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Product
+from database import get_session
+from ml_service import ml_service
+from vector_index import normalize_rows
+from attribute_filter import CATEGORICAL_FILTERS
+import pgvector_backend
+from response_cache import response_cache
+
+WARMUP_BATCH_SIZE = 1000
+# Seconds between warm-up attempts when the database is unreachable
+WARMUP_RETRY_DELAY = 10
+# Seconds between incremental cache refreshes (0 disables polling)
+DELTA_POLL_INTERVAL = int(os.getenv("ML_DELTA_POLL_INTERVAL", "60"))
+
+
+def _embedded():
+    # Rows embedded by the serving backbone; embeddings from another model live in a different space
+    return and_(Product.embedding != None, Product.embedding_model == ml_service.model_id)
+
+
+def _attribute_columns() -> tuple:
+    # Row layout expected by CatalogAttributes.update, after the product id
+    return (Product.category_id, Product.price, *(getattr(Product, column) for column in CATEGORICAL_FILTERS.values()))
+
+
+def _parse_embedding(text: str) -> np.ndarray:
+    # "[0.1, 0.2, ...]" -> float32 vector without materializing Python floats
+    text = text.strip() if text else ""
+    if len(text) < 3 or text[0] != "[":
+        return np.empty(0, dtype=np.float32)
+    return np.fromstring(text[1:-1], dtype=np.float32, sep=',')
+
+
+def _decode_batch(rows: list, ids: np.ndarray, matrix: Optional[np.ndarray], filled: int) -> Tuple[np.ndarray, Optional[np.ndarray], int]:
+    """Parses one batch of (id, embedding text) rows into ids/matrix from position `filled`; runs in a worker thread."""
+    for pid, emb_text in rows:
+        vec = _parse_embedding(emb_text)
+        if vec.size == 0:
+            continue
+        if matrix is None:
+            matrix = np.empty((len(ids), vec.size), dtype=np.float32)
+        if vec.size != matrix.shape[1]:
+            print(f"⚠️  Skipping product {pid}: embedding has {vec.size} dims, expected {matrix.shape[1]}")
+            continue
+        if filled == len(ids):
+            # Rows were inserted after the count query; grow geometrically
+            ids = np.resize(ids, len(ids) * 2)
+            matrix = np.resize(matrix, (len(ids), matrix.shape[1]))
+        ids[filled] = pid
+        matrix[filled] = vec
+        filled += 1
+    return ids, matrix, filled
+
+
+async def stream_embeddings(session: AsyncSession, expected_rows: int, batch_size: int = WARMUP_BATCH_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Streams (id, embedding) in primary-key order using keyset pagination
+    (id > last_id), so every batch is an index range scan regardless of depth.
+    Each batch is decoded straight into a preallocated float32 matrix, in a
+    worker thread so the event loop keeps serving requests meanwhile.
+    """
+    capacity = max(expected_rows, 1)
+    ids = np.empty(capacity, dtype=np.int64)
+    matrix = None
+    filled = 0
+    last_id = 0
+    start = time.perf_counter()
+
+    while True:
+        # The embedding is fetched as its JSON text and parsed with NumPy
+        batch_stmt = (
+            select(Product.id, cast(Product.embedding, String))
+            .where(_embedded(), Product.id > last_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+        )
+        rows = (await session.execute(batch_stmt)).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ids, matrix, filled = await asyncio.to_thread(_decode_batch, rows, ids, matrix, filled)
+
+        elapsed = time.perf_counter() - start
+        print(f"➡️ Loaded {filled}/{expected_rows} embeddings (up to id {last_id}, {filled / max(elapsed, 1e-6):,.0f} rows/s)")
+
+    if matrix is None:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    elapsed = time.perf_counter() - start
+    print(f"📥 Streamed {filled} embeddings in {elapsed:.1f}s ({filled / max(elapsed, 1e-6):,.0f} rows/s)")
+    return ids[:filled], await asyncio.to_thread(normalize_rows, matrix[:filled])
+
+
+async def load_attributes(session: AsyncSession, batch_size: int = WARMUP_BATCH_SIZE * 10) -> int:
+    """Loads the filterable attributes of every embedded product (keyset batches, no embeddings)."""
+    last_id, loaded = 0, 0
+    while True:
+        stmt = (
+            select(Product.id, *_attribute_columns())
+            .where(_embedded(), Product.id > last_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+        )
+        rows = (await session.execute(stmt)).all()
+        if not rows:
+            break
+        await asyncio.to_thread(ml_service.attributes.update, rows)
+        last_id = rows[-1][0]
+        loaded += len(rows)
+    print(f"🏷️  Loaded search filter attributes for {loaded} products")
+    return loaded
+
+
+async def warm_ml_cache() -> bool:
+    """Fills the ML cache from the embedding store, falling back to the database."""
+    print("🚀 Initializing ML Cache...")
+    try:
+        async for session in get_session():
+            if pgvector_backend.ACTIVE:
+                # Postgres holds the vectors and the ANN index; nothing to load into this worker
+                count = await pgvector_backend.count_vectors(session, ml_service.model_id)
+                print(f"🐘 Similarity search served by pgvector ({pgvector_backend.PGVECTOR_INDEX} index, {count} products)")
+                ml_service.cache_ready = True
+                return True
+            stats_stmt = select(func.count(Product.id), func.sum(Product.id), func.max(Product.updated_at)).where(_embedded())
+            total_count, id_sum, high_water = (await session.execute(stats_stmt)).one()
+            total_count, id_sum = total_count or 0, int(id_sum or 0)
+            print(f"📦 Total products to cache: {total_count}")
+            other_stmt = select(func.count(Product.id)).where(
+                Product.embedding_model != None, Product.embedding_model != ml_service.model_id)
+            other_models = (await session.execute(other_stmt)).scalar() or 0
+            if other_models:
+                print(f"⚠️  Ignoring {other_models} products embedded by another backbone than {ml_service.model_id}. "
+                      f"Run generate_embeddings.py to re-embed them.")
+
+            # Fast path: memory-map the on-disk embedding store written by the embedding scripts.
+            # Index building (k-means, PQ training), PCA and np.save are CPU-bound: worker thread.
+            if not await asyncio.to_thread(ml_service.load_from_store, expected_rows=total_count, expected_id_sum=id_sum):
+                # high_water is read before streaming, so rows changed meanwhile are re-polled later
+                ids, matrix = await stream_embeddings(session, total_count)
+                # Persist so the next worker/restart can memory-map instead of re-querying
+                await asyncio.to_thread(ml_service.sync_matrix, ids, matrix, source_rows=total_count,
+                                        persist=True, high_water=high_water, source_id_sum=id_sum)
+            await load_attributes(session)
+            ml_service.cache_ready = True
+            return True
+    except Exception as e:
+        print(f"❌ Error during ML Cache Init: {e}")
+        import traceback
+        traceback.print_exc()
+    return False
+
+
+def _apply_delta_batch(rows: list) -> Tuple[int, int]:
+    """Applies one batch of poll_deltas rows to the attributes and the live index. Returns (upserted, removed)."""
+    # Stored embeddings are full-dimension; the index may hold PCA-reduced vectors
+    expected_dim = ml_service.projection.input_dim if ml_service.projection is not None else ml_service.index.dim
+    # Attributes first, so filtered searches see the new values as soon as the vectors land
+    ml_service.attributes.update((row[0], *row[4:]) for row in rows)
+    ids, vectors, cleared = [], [], []
+    for pid, emb_text, _, model_id, *_ in rows:
+        vec = _parse_embedding(emb_text) if model_id == ml_service.model_id else None
+        if vec is None or vec.size == 0:
+            cleared.append(pid)
+        elif expected_dim and vec.size != expected_dim:
+            print(f"⚠️  Skipping product {pid}: embedding has {vec.size} dims, expected {expected_dim}")
+        else:
+            ids.append(pid)
+            vectors.append(vec)
+
+    if ids:
+        ml_service.upsert_products(np.array(ids, dtype=np.int64), np.stack(vectors))
+    removed = ml_service.remove_products(np.array(cleared, dtype=np.int64))
+    return len(ids), removed
+
+
+async def poll_deltas(session: AsyncSession, batch_size: int = WARMUP_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    Applies products changed since ml_service.high_water to the live index,
+    paging on the (updated_at, id) key. Rows whose embedding was cleared, or
+    replaced by another backbone's, are removed. If the number of embedded
+    rows or the sum of their ids no longer matches, deleted products are
+    reconciled by id.
+    Returns (upserted, removed).
+    """
+    upserted = removed = 0
+    last_ts, last_id = ml_service.high_water, None
+
+    while True:
+        stmt = (
+            select(Product.id, cast(Product.embedding, String), Product.updated_at, Product.embedding_model,
+                   *_attribute_columns())
+            .where(Product.updated_at != None)
+        )
+        if last_id is not None:
+            stmt = stmt.where(or_(Product.updated_at > last_ts, and_(Product.updated_at == last_ts, Product.id > last_id)))
+        elif last_ts is not None:
+            # Everything at the high-water mark itself was applied by the previous poll
+            stmt = stmt.where(Product.updated_at > last_ts)
+        stmt = stmt.order_by(Product.updated_at, Product.id).limit(batch_size)
+        rows = (await session.execute(stmt)).all()
+        if not rows:
+            break
+        last_id, last_ts = rows[-1][0], rows[-1][2]
+        # Parsing, projection and the index update are CPU-bound: worker thread
+        batch_upserted, batch_removed = await asyncio.to_thread(_apply_delta_batch, rows)
+        upserted += batch_upserted
+        removed += batch_removed
+        ml_service.high_water = last_ts
+
+    # Deletions leave no updated_at trace; detect them through the row count and id sum
+    count_stmt = select(func.count(Product.id), func.sum(Product.id)).where(_embedded())
+    total_count, id_sum = (await session.execute(count_stmt)).one()
+    total_count, id_sum = total_count or 0, int(id_sum or 0)
+    if (total_count, id_sum) != (ml_service.source_rows, ml_service.source_id_sum):
+        db_ids = (await session.execute(select(Product.id).where(_embedded()))).scalars().all()
+        index_ids = ml_service.index.ids[ml_service.index.alive]
+        gone = np.setdiff1d(index_ids, np.array(db_ids, dtype=np.int64))
+        removed += await asyncio.to_thread(ml_service.remove_products, gone)
+        ml_service.source_rows, ml_service.source_id_sum = total_count, id_sum
+
+    return upserted, removed
+
+
+async def refresh_response_cache(session: AsyncSession) -> bool:
+    """
+    Invalidates the cached catalog responses (featured, popular, ...) once
+    products were added, changed or deleted. Returns whether it did.
+    """
+    stmt = select(func.count(Product.id), func.max(Product.updated_at))
+    version = tuple((await session.execute(stmt)).one())
+    if version == response_cache.catalog_version:
+        return False
+    response_cache.catalog_version = version
+    response_cache.invalidate()
+    return True
+
+
+async def delta_poll_loop(interval: int = DELTA_POLL_INTERVAL):
+    """Keeps the ML cache and the response cache in sync with the database after warm-up."""
+    if interval <= 0:
+        return
+    if pgvector_backend.ACTIVE:
+        # The database index is always current; only the offline recommendation table can change
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async for session in get_session():
+                    await refresh_response_cache(session)
+                    break
+            except Exception as e:
+                print(f"❌ Error during response cache refresh: {e}")
+            ml_service.reload_recommendations()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async for session in get_session():
+                upserted, removed = await poll_deltas(session)
+                if upserted or removed:
+                    print(f"🔄 ML cache delta: {upserted} upserted, {removed} removed ({len(ml_service.index)} products)")
+                await refresh_response_cache(session)
+                break
+            ml_service.reload_recommendations()
+        except Exception as e:
+            print(f"❌ Error during ML cache delta poll: {e}")
+
+
+async def warm_model() -> bool:
+    print("🧠 Loading feature extraction model...")
+    try:
+        # Model construction is blocking (weights download + init), keep it off the event loop
+        await asyncio.to_thread(ml_service._ensure_initialized)
+        return True
+    except Exception as e:
+        print(f"❌ Error loading ML model: {e}")
+        import traceback
+        traceback.print_exc()
+    return False
+
+
+async def _retry(step, name: str):
+    while not await step():
+        print(f"🔁 Retrying {name} in {WARMUP_RETRY_DELAY}s...")
+        await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+
+async def warm_up():
+    """
+    Background warm-up started from main.on_startup. Loads the model and the
+    embedding cache concurrently while the API already serves traffic; each
+    step is retried until it succeeds. /health/ready flips once both are done,
+    after which the task keeps polling for incremental changes.
+    """
+    start = time.perf_counter()
+    await asyncio.gather(_retry(warm_model, "model load"), _retry(warm_ml_cache, "ML cache warm-up"))
+    print(f"✨ ML Service ready in {time.perf_counter() - start:.1f}s.")
+    await delta_poll_loop()
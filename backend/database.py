@@ -42,6 +42,9 @@ async def init_db():
     async with engine.begin() as conn:
         # await conn.run_sync(SQLModel.metadata.drop_all) # Dangerous for production!
         await conn.run_sync(SQLModel.metadata.create_all)
+        # Columns added after the initial schema are not handled by create_all
+        from migrations import run_migrations
+        await conn.run_sync(run_migrations)
 
 async def get_session() -> AsyncSession:
     async_session = sessionmaker(
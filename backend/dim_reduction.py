@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from typing import Optional
+from vector_index import normalize_rows
+
+# Dimensionality Reduction Configuration - Configurable via .env
+# Directory for fitted ML artifacts that live alongside the model weights
+ARTIFACTS_DIR = os.getenv("ML_ARTIFACTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml_artifacts"))
+PCA_PATH = os.getenv("ML_PCA_PATH", os.path.join(ARTIFACTS_DIR, "pca.npz"))
+# Opt-in: target dimension (e.g. 256) of the projection fitted by generate_embeddings.py.
+# 0 (default) = no PCA; vectors are searched at full dimension and a previously
+# fitted projection is ignored, since it changes the ranking.
+PCA_DIM = int(os.getenv("ML_PCA_DIM", "0"))
+PCA_WHITEN = os.getenv("ML_PCA_WHITEN", "false").lower() == "true"
+# Set to "off" to ignore a fitted projection at serving time
+PCA_ENABLED = PCA_DIM > 0 and os.getenv("ML_PCA", "on").lower() != "off"
+
+
+class PCAProjection:
+    """
+    Fit-once linear projection of L2-normalized embeddings onto their top
+    principal components, with optional whitening. Outputs are re-normalized
+    so cosine similarity stays a dot product.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: np.ndarray, whiten: bool = False):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)  # (out_dim, in_dim)
+        self.explained_variance = explained_variance.astype(np.float32)
+        self.whiten = whiten
+        self._matrix = self.components.T.copy()
+        if whiten:
+            self._matrix /= np.sqrt(self.explained_variance + 1e-8)[None, :]
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, x: np.ndarray, n_components: int, whiten: bool = False, max_samples: int = 50_000) -> "PCAProjection":
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) > max_samples:
+            x = x[np.random.default_rng(0).choice(len(x), max_samples, replace=False)]
+        n_components = min(n_components, x.shape[0], x.shape[1])
+
+        mean = x.mean(axis=0)
+        centered = x - mean
+        # Eigen-decomposition of the (D, D) covariance is cheaper than SVD of (N, D) for N >> D
+        cov = (centered.T @ centered) / max(len(x) - 1, 1)
+        eigvals, eigvecs = np.linalg.eigh(cov.astype(np.float64))
+        order = np.argsort(eigvals)[::-1][:n_components]
+        return cls(mean, eigvecs[:, order].T, eigvals[order], whiten)
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        return normalize_rows((x - self.mean) @ self._matrix)
+
+    def retained_variance(self, total_variance: Optional[float] = None) -> float:
+        total = total_variance if total_variance is not None else float(self.explained_variance.sum())
+        return float(self.explained_variance.sum()) / total if total else 0.0
+
+    def save(self, path: str = PCA_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, mean=self.mean, components=self.components,
+                 explained_variance=self.explained_variance, whiten=np.array(self.whiten))
+
+    @classmethod
+    def load(cls, path: str = PCA_PATH) -> Optional["PCAProjection"]:
+        if not PCA_ENABLED or not os.path.exists(path):
+            return None
+        data = np.load(path)
+        return cls(data["mean"], data["components"], data["explained_variance"], bool(data["whiten"]))
+
+
+def fit_and_save(vectors: np.ndarray, n_components: int = PCA_DIM, whiten: bool = PCA_WHITEN, path: str = PCA_PATH) -> Optional[PCAProjection]:
+    """Fits a projection over catalog embeddings and stores it next to the model."""
+    if n_components <= 0 or len(vectors) == 0:
+        return None
+    x = normalize_rows(vectors)
+    projection = PCAProjection.fit(x, n_components, whiten)
+    total_variance = float(x.var(axis=0, ddof=1).sum())
+    projection.save(path)
+    print(f"📉 PCA fitted: {projection.input_dim} -> {projection.output_dim} dims "
+          f"({projection.retained_variance(total_variance):.1%} variance retained, whiten={whiten}). Saved to {path}")
+    return projection
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import numpy as np
+from typing import Optional, Tuple
+from dim_reduction import ARTIFACTS_DIR
+from vector_index import normalize_rows
+
+# Embedding Store Configuration - Configurable via .env
+STORE_DIR = os.getenv("ML_EMBEDDING_STORE_DIR", os.path.join(ARTIFACTS_DIR, "embeddings"))
+# Set to "off" to always warm the cache from the database
+STORE_ENABLED = os.getenv("ML_EMBEDDING_STORE", "on").lower() != "off"
+
+FORMAT_VERSION = 2
+# Stores written before backbones were configurable hold ResNet50 embeddings
+LEGACY_MODEL_ID = "resnet50:IMAGENET1K_V1:224"
+MANIFEST = "current.json"
+LOCK = "write.lock"
+# A writer lock older than this is assumed to belong to a crashed process
+LOCK_TIMEOUT = 600
+
+
+def _manifest_path(store_dir: str) -> str:
+    return os.path.join(store_dir, MANIFEST)
+
+
+def write_store(ids: np.ndarray, vectors: np.ndarray, source_rows: Optional[int] = None,
+                high_water=None, model_id: str = LEGACY_MODEL_ID, store_dir: str = STORE_DIR,
+                source_id_sum: Optional[int] = None) -> Optional[str]:
+    """
+    Writes L2-normalized float32 embeddings and their product ids as .npy files
+    under a new version stamp, then atomically repoints current.json at them.
+    Workers that already mapped an older version keep reading it untouched.
+
+    source_rows is the number of database rows with a non-NULL embedding at
+    export time (including empty ones) and source_id_sum the sum of their ids,
+    which also changes when as many products were deleted as inserted; the
+    API compares both on startup to detect a stale store. high_water is the
+    latest product.updated_at covered by the export (datetime or ISO string);
+    the API polls for changes after it.
+    model_id identifies the backbone that produced the vectors.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    vectors = np.ascontiguousarray(normalize_rows(vectors), dtype=np.float32)
+    if len(ids) != len(vectors):
+        raise ValueError(f"ids ({len(ids)}) and vectors ({len(vectors)}) are not aligned")
+
+    os.makedirs(store_dir, exist_ok=True)
+    if not _acquire_lock(store_dir):
+        print("⏭️  Another process is writing the embedding store, skipping.")
+        return None
+    try:
+        return _write_version(ids, vectors, source_rows, high_water, model_id, store_dir, source_id_sum)
+    finally:
+        _release_lock(store_dir)
+
+
+def _write_version(ids: np.ndarray, vectors: np.ndarray, source_rows: Optional[int], high_water,
+                   model_id: str, store_dir: str, source_id_sum: Optional[int] = None) -> str:
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+    vectors_file = f"embeddings-{version}.npy"
+    ids_file = f"ids-{version}.npy"
+    np.save(os.path.join(store_dir, vectors_file), vectors)
+    np.save(os.path.join(store_dir, ids_file), ids)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "model": model_id,
+        "vectors": vectors_file,
+        "ids": ids_file,
+        "count": int(len(ids)),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "max_id": int(ids.max()) if len(ids) else 0,
+        "source_rows": int(source_rows if source_rows is not None else len(ids)),
+        "source_id_sum": int(source_id_sum if source_id_sum is not None else ids.sum()),
+        "high_water": high_water.isoformat() if hasattr(high_water, "isoformat") else high_water,
+    }
+    tmp_path = _manifest_path(store_dir) + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, _manifest_path(store_dir))
+
+    _remove_stale_versions(store_dir, keep={vectors_file, ids_file})
+    print(f"💾 Wrote embedding store {version}: {len(ids)} x {manifest['dim']} float32 -> {store_dir}")
+    return version
+
+
+def _acquire_lock(store_dir: str) -> bool:
+    path = os.path.join(store_dir, LOCK)
+    try:
+        if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def _release_lock(store_dir: str):
+    try:
+        os.remove(os.path.join(store_dir, LOCK))
+    except OSError:
+        pass
+
+
+def _remove_stale_versions(store_dir: str, keep: set):
+    # Unlinking is safe on POSIX even if another worker still has the file mapped
+    for name in os.listdir(store_dir):
+        if name.endswith(".npy") and name not in keep:
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                pass
+
+
+def read_manifest(store_dir: str = STORE_DIR) -> Optional[dict]:
+    path = _manifest_path(store_dir)
+    if not STORE_ENABLED or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        print(f"⚠️  Ignoring embedding store with unsupported format {manifest.get('format')}")
+        return None
+    manifest.setdefault("model", LEGACY_MODEL_ID)
+    return manifest
+
+
+def load_store(store_dir: str = STORE_DIR) -> Optional[Tuple[np.ndarray, np.ndarray, dict]]:
+    """
+    Memory-maps the current store read-only. Pages are shared through the OS
+    page cache, so every uvicorn worker reuses the same physical memory.
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return None
+    try:
+        vectors = np.load(os.path.join(store_dir, manifest["vectors"]), mmap_mode="r")
+        ids = np.load(os.path.join(store_dir, manifest["ids"]))
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not open embedding store {manifest.get('version')}: {e}")
+        return None
+    if len(ids) != len(vectors):
+        print(f"⚠️  Embedding store {manifest.get('version')} is corrupt (ids/vectors mismatch)")
+        return None
+    return ids, vectors, manifest
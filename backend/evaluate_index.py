@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import numpy as np
+from vector_index import ExactIndex, IVFIndex, normalize_rows, recall_at_k
+from quantization import CODECS, create_codec
+from dim_reduction import PCAProjection
+from ml_service import ml_service
+
+# Configuration
+DB_PATH = "fashion_fiesta.db"
+
+
+def load_embeddings(db_path: str):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    # Only embeddings from the configured backbone; other models' vectors are not comparable
+    cursor.execute("SELECT id, embedding FROM product WHERE embedding IS NOT NULL AND embedding != '[]' "
+                   "AND embedding_model = ?", (ml_service.model_id,))
+    ids, vectors = [], []
+    for pid, emb_json in cursor:
+        emb = json.loads(emb_json)
+        if emb:
+            ids.append(pid)
+            vectors.append(emb)
+    conn.close()
+    return np.array(ids, dtype=np.int64), normalize_rows(np.array(vectors, dtype=np.float32))
+
+
+def mean_latency_ms(index, queries, k, **kwargs):
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q, k, **kwargs)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def evaluate(db_path: str, k: int, n_queries: int, nlist: int, nprobes, codecs, rerank: int, pca_dims, whiten: bool):
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}")
+        return
+
+    ids, vectors = load_embeddings(db_path)
+    if len(ids) == 0:
+        print("No embeddings found. Run generate_embeddings.py first.")
+        return
+    print(f"Loaded {len(ids)} embeddings ({vectors.shape[1]}-d).")
+
+    # Queries are perturbed catalog vectors, mimicking photos of catalog items
+    rng = np.random.default_rng(42)
+    picks = rng.choice(len(ids), min(n_queries, len(ids)), replace=False)
+    queries = normalize_rows(vectors[picks] + rng.normal(scale=0.01, size=vectors[picks].shape).astype(np.float32))
+
+    exact = ExactIndex()
+    exact.build(ids, vectors)
+    print(f"exact        recall@{k}: 1.000  latency: {mean_latency_ms(exact, queries, k):.2f} ms  "
+          f"memory: {exact.memory_bytes() / 1e6:.1f} MB")
+
+    for name in codecs:
+        if name == "float32":
+            continue
+        for r in sorted({0, rerank}):
+            quantized = ExactIndex(codec=create_codec(name), rerank=r)
+            quantized.build(ids, vectors)
+            recall = recall_at_k(quantized, exact, queries, k)
+            latency = mean_latency_ms(quantized, queries, k)
+            print(f"{name:<8} rerank={r:<4} recall@{k}: {recall:.3f}  latency: {latency:.2f} ms  "
+                  f"memory: {quantized.memory_bytes() / 1e6:.1f} MB")
+
+    for dim in pca_dims:
+        # Fitted on the catalog, applied to both catalog and queries as in MLService
+        projection = PCAProjection.fit(vectors, dim, whiten)
+        reduced = ExactIndex()
+        reduced.build(ids, projection.transform(vectors))
+        reduced_queries = projection.transform(queries)
+        hits = 0
+        for q, rq in zip(queries, reduced_queries):
+            hits += len(set(exact.search(q, k)[0].tolist()) & set(reduced.search(rq, k)[0].tolist()))
+        recall = hits / (len(queries) * min(k, len(ids)))
+        latency = mean_latency_ms(reduced, reduced_queries, k)
+        print(f"pca dim={projection.output_dim:<5} recall@{k}: {recall:.3f}  latency: {latency:.2f} ms  "
+              f"memory: {reduced.memory_bytes() / 1e6:.1f} MB")
+
+    ivf = IVFIndex(nlist=nlist)
+    ivf.build(ids, vectors)
+    for nprobe in nprobes:
+        ivf.nprobe = nprobe
+        recall = recall_at_k(ivf, exact, queries, k)
+        latency = mean_latency_ms(ivf, queries, k)
+        print(f"ivf nprobe={nprobe:<4} recall@{k}: {recall:.3f}  latency: {latency:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare approximate index and quantized storage recall/latency against exact search.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--k", type=int, default=24)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF cells (0 = auto)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--codecs", nargs="*", default=list(CODECS), choices=list(CODECS),
+                        help="Storage codecs to compare against float32")
+    parser.add_argument("--rerank", type=int, default=100, help="Candidates re-scored exactly for quantized codecs")
+    parser.add_argument("--pca-dim", type=int, nargs="*", default=[128, 256, 512],
+                        help="PCA target dimensions to compare against full-dimension search")
+    parser.add_argument("--whiten", action="store_true", help="Whiten the PCA projection")
+    args = parser.parse_args()
+    evaluate(args.db, args.k, args.queries, args.nlist, args.nprobe, args.codecs, args.rerank, args.pca_dim, args.whiten)
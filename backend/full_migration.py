@@ -2,26 +2,16 @@ import os
 import asyncio
 import sqlite3
 import httpx
-import math
 from sqlmodel import Session, select, create_engine, SQLModel, func
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from database import init_db
 from models import Product, Category, User
+from json_utils import sanitize_value
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def sanitize_value(v):
-    """Recursively replaces NaN with None for JSON compatibility."""
-    if isinstance(v, float) and math.isnan(v):
-        return None
-    if isinstance(v, dict):
-        return {k: sanitize_value(val) for k, val in v.items()}
-    if isinstance(v, list):
-        return [sanitize_value(val) for val in v]
-    return v
-
 # Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
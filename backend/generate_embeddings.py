@@ -2,79 +2,268 @@
 import os
 import sqlite3
 import json
-import torch
-from PIL import Image
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from tqdm import tqdm
 from ml_service import ml_service
+from image_embedding_cache import image_embedding_cache, content_digest
+from dim_reduction import fit_and_save, ARTIFACTS_DIR, PCA_DIM
+from embedding_store import write_store
+from recommendation_table import build_table, RECS_ENABLED
 import numpy as np
 
 # Configuration
 DB_PATH = "fashion_fiesta.db"
 DATASET_PATH = r"C:\Users\Lenovo\.cache\kagglehub\datasets\paramaggarwal\fashion-product-images-dataset\versions\1\fashion-dataset"
 IMAGES_DIR = os.path.join(DATASET_PATH, "images")
-BATCH_SIZE = 32
+# Pipeline defaults, overridable from the command line
+BATCH_SIZE = 128
+DECODE_WORKERS = os.cpu_count() or 4
+# Decoded batches buffered ahead of inference
+PREFETCH_BATCHES = 4
+CHECKPOINT_PATH = os.path.join(ARTIFACTS_DIR, "generate_embeddings.checkpoint.json")
 
-def generate_embeddings():
+
+def _image_path(img_urls_json: str):
+    img_urls = json.loads(img_urls_json or "[]")
+    if not img_urls:
+        return None
+    img_path = os.path.join(IMAGES_DIR, img_urls[0].split('/')[-1])
+    return img_path if os.path.exists(img_path) else None
+
+
+def _decode(pid: int, img_urls_json: str):
+    """
+    Runs on a decoder worker. Returns (pid, digest, image, vector): vector is set
+    when this exact image was embedded before (content-addressed cache), image
+    when it still needs inference, neither if it cannot be used.
+    """
+    try:
+        img_path = _image_path(img_urls_json)
+        if not img_path:
+            return pid, None, None, None
+        with open(img_path, "rb") as f:
+            data = f.read()
+        digest = content_digest(data)
+        vector = image_embedding_cache.get(digest, ml_service.model_id)
+        if vector is not None:
+            return pid, digest, None, vector
+        # Draft-mode decode straight to the model input size (same path as uploads)
+        return pid, digest, ml_service.load_image(data), None
+    except Exception as e:
+        print(f"Error loading image for product {pid}: {e}")
+        return pid, None, None, None
+
+
+def load_checkpoint(path: str = CHECKPOINT_PATH) -> int:
+    """Last product id fully written by an interrupted run with the same backbone (0 = start over)."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    return state["last_id"] if state.get("model_id") == ml_service.model_id else 0
+
+
+def save_checkpoint(last_id: int, path: str = CHECKPOINT_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"model_id": ml_service.model_id, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+
+def _writer(updates: "queue.Queue", stats: dict):
+    """
+    Writer thread: one executemany + commit per batch on its own connection,
+    records new images in the image embedding cache, then advances the
+    checkpoint past the batch. Batches arrive in id order.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    while True:
+        item = updates.get()
+        if item is None:
+            break
+        pids, embeddings, last_id, failed, new_images = item
+        try:
+            if pids:
+                # Same text format SQLAlchemy uses for DateTime on SQLite; bumps the ML cache delta poll
+                now = datetime.utcnow().isoformat(sep=' ')
+                rows = [(json.dumps(emb.tolist()), ml_service.model_id, now, pid) for emb, pid in zip(embeddings, pids)]
+                cursor.executemany("UPDATE product SET embedding = ?, embedding_model = ?, updated_at = ? WHERE id = ?", rows)
+                conn.commit()
+            # Remember freshly embedded images so later runs (and the API) skip them
+            image_embedding_cache.put_many(new_images, ml_service.model_id)
+            stats["written"] += len(pids)
+        except Exception as e:
+            print(f"Error writing embeddings up to product {last_id}: {e}")
+            conn.rollback()
+            failed += len(pids)
+        stats["failed"] += failed
+        # Never checkpoint past a failed batch, so a resumed run retries it
+        if not stats["failed"]:
+            save_checkpoint(last_id)
+    conn.close()
+
+
+def generate_embeddings(workers: int = DECODE_WORKERS, batch_size: int = BATCH_SIZE,
+                        prefetch: int = PREFETCH_BATCHES, restart: bool = False):
+    """
+    Pipelined, resumable embedding job:
+    decoder threads -> bounded prefetch queue -> batched inference (this thread)
+    -> writer thread doing bulk UPDATEs. Images already in the content-addressed
+    image embedding cache skip decoding and inference. Products are processed in id order and
+    the checkpoint records the last id written, so an interrupted run resumes
+    where it stopped instead of rescanning products it already skipped.
+    """
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
         return
 
+    start_id = 0 if restart else load_checkpoint()
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
-    # Get all products that don't have embeddings yet
-    # Or just get all products if we want to refresh
-    cursor.execute("SELECT id, image_urls FROM product WHERE embedding IS NULL OR embedding = '[]'")
+    # Get all products that don't have embeddings yet, or whose embedding
+    # came from a different backbone than the one configured (ML_BACKBONE)
+    cursor.execute("SELECT id, image_urls FROM product WHERE id > ? AND "
+                   "(embedding IS NULL OR embedding = '[]' OR embedding_model IS NOT ?) ORDER BY id",
+                   (start_id, ml_service.model_id))
     products = cursor.fetchall()
+    conn.close()
 
     if not products:
         print("No products found needing embeddings.")
+        if os.path.exists(CHECKPOINT_PATH):
+            os.remove(CHECKPOINT_PATH)
         return
 
-    print(f"Generating embeddings for {len(products)} products...")
-
-    # Use batches for database updates
-    batch_updates = []
-    
-    for i in tqdm(range(0, len(products), BATCH_SIZE)):
-        batch = products[i:i+BATCH_SIZE]
-        batch_imgs = []
-        batch_pids = []
-        
-        for pid, img_urls_json in batch:
-            try:
-                img_urls = json.loads(img_urls_json)
-                if not img_urls:
-                    continue
-                
-                img_name = img_urls[0].split('/')[-1]
-                img_path = os.path.join(IMAGES_DIR, img_name)
-                
-                if not os.path.exists(img_path):
-                    continue
-
-                img = Image.open(img_path)
-                batch_imgs.append(img)
-                batch_pids.append(pid)
-                
-            except Exception as e:
-                print(f"Error loading image for product {pid}: {e}")
-
-        if batch_imgs:
-            try:
-                embeddings = ml_service.extract_features_batch(batch_imgs)
-                updates = [(json.dumps(emb.tolist()), pid) for emb, pid in zip(embeddings, batch_pids)]
-                cursor.executemany("UPDATE product SET embedding = ? WHERE id = ?", updates)
-                conn.commit()
-            except Exception as e:
-                print(f"Error during batch inference/update: {e}")
-            finally:
-                # Close all images in batch
-                for img in batch_imgs:
-                    img.close()
+    resumed = f" (resuming after product {start_id})" if start_id else ""
+    print(f"Generating embeddings for {len(products)} products{resumed} "
+          f"with {workers} decoder workers, batch size {batch_size}...")
+
+    batches = [products[i:i + batch_size] for i in range(0, len(products), batch_size)]
+    decoded: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+    updates: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+    stats = {"written": 0, "failed": 0}
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="decoder")
+
+    def produce():
+        # Submits decode jobs batch by batch; blocks once `prefetch` batches are waiting
+        for batch in batches:
+            decoded.put((batch[-1][0], [pool.submit(_decode, pid, urls) for pid, urls in batch]))
+        decoded.put(None)
+
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    writer = threading.Thread(target=_writer, args=(updates, stats), name="writer")
+    producer.start()
+    writer.start()
+
+    start = time.perf_counter()
+    skipped = reused = 0
+    try:
+        with tqdm(total=len(products), unit="img") as progress:
+            while True:
+                item = decoded.get()
+                if item is None:
+                    break
+                last_id, futures = item
+                results = [f.result() for f in futures]
+                batch_pids, batch_vectors = [], []
+                # Unique images still needing inference; products sharing an image reuse one row
+                to_embed, pending = {}, []
+                for pid, digest, img, vector in results:
+                    if vector is not None:
+                        batch_pids.append(pid)
+                        batch_vectors.append(vector)
+                        reused += 1
+                    elif img is not None:
+                        if digest in to_embed:
+                            img.close()
+                        else:
+                            to_embed[digest] = img
+                        pending.append((pid, digest))
+                    else:
+                        skipped += 1
+
+                failed, new_images = 0, []
+                if to_embed:
+                    try:
+                        # Stored embeddings stay full-dimension; the PCA projection is applied at load time
+                        embeddings = ml_service.extract_features_batch(list(to_embed.values()), project=False)
+                        by_digest = dict(zip(to_embed, embeddings))
+                        new_images = list(by_digest.items())
+                        for pid, digest in pending:
+                            batch_pids.append(pid)
+                            batch_vectors.append(by_digest[digest])
+                    except Exception as e:
+                        print(f"Error during batch inference: {e}")
+                        failed = len(pending)
+                    finally:
+                        for img in to_embed.values():
+                            img.close()
+                updates.put((batch_pids, batch_vectors, last_id, failed, new_images))
 
+                progress.update(len(results))
+                progress.set_postfix(img_per_s=f"{progress.n / (time.perf_counter() - start):.1f}")
+    finally:
+        updates.put(None)
+        writer.join()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"Embedding generation complete: {stats['written']} embedded ({reused} reused from the image embedding cache), "
+          f"{skipped} skipped (no image), {stats['failed']} failed in {elapsed:.1f}s ({stats['written'] / max(elapsed, 1e-6):.1f} images/sec).")
+    # A failed batch keeps the checkpoint before it, so the next run resumes there
+    if not stats["failed"] and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+
+def export_catalog():
+    """
+    Reads every catalog embedding once, learns the PCA projection over it
+    when ML_PCA_DIM is set, writes the memory-mappable embedding store used
+    by the API and precomputes the recommendation table.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # Only embeddings from the configured backbone; the API ignores the rest
+    cursor.execute("SELECT COUNT(*), SUM(id), MAX(updated_at) FROM product WHERE embedding IS NOT NULL AND embedding_model = ?",
+                   (ml_service.model_id,))
+    source_rows, source_id_sum, high_water = cursor.fetchone()
+    cursor.execute("SELECT id, embedding FROM product WHERE embedding IS NOT NULL AND embedding != '[]' "
+                   "AND embedding_model = ? ORDER BY id", (ml_service.model_id,))
+    ids, vectors = [], []
+    for pid, emb_json in cursor:
+        emb = json.loads(emb_json)
+        if emb:
+            ids.append(pid)
+            vectors.append(emb)
     conn.close()
-    print("Embedding generation complete.")
+
+    if not vectors:
+        print("No embeddings available to export.")
+        return
+
+    vectors = np.array(vectors, dtype=np.float32)
+    if PCA_DIM > 0:
+        fit_and_save(vectors)
+    ids = np.array(ids, dtype=np.int64)
+    version = write_store(ids, vectors, source_rows=source_rows, high_water=high_water, model_id=ml_service.model_id,
+                          source_id_sum=source_id_sum or 0)
+    if RECS_ENABLED and version is not None:
+        build_table(ids, vectors, {"model": ml_service.model_id, "source_rows": source_rows,
+                                   "source_id_sum": source_id_sum or 0})
 
 if __name__ == "__main__":
-    generate_embeddings()
+    parser = argparse.ArgumentParser(description="Embed catalog images, then export the embedding store and recommendations.")
+    parser.add_argument("--workers", type=int, default=DECODE_WORKERS, help="Image decoder threads")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per inference batch")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_BATCHES, help="Decoded batches buffered ahead of inference")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    generate_embeddings(args.workers, args.batch_size, args.prefetch, args.restart)
+    export_catalog()
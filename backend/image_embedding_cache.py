@@ -0,0 +1,87 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Iterable, Optional, Tuple
+from dim_reduction import ARTIFACTS_DIR
+
+# Image Embedding Cache Configuration - Configurable via .env
+# Content-addressed store shared by the embedding scripts and the image-search API
+IMAGE_CACHE_PATH = os.getenv("ML_IMAGE_EMBEDDING_CACHE_PATH", os.path.join(ARTIFACTS_DIR, "image_embeddings.sqlite3"))
+# Set to "off" to always run inference
+IMAGE_CACHE_ENABLED = os.getenv("ML_IMAGE_EMBEDDING_CACHE", "on").lower() != "off"
+
+
+def content_digest(data: bytes) -> str:
+    """Identity of an image: SHA-256 of its encoded bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageEmbeddingCache:
+    """
+    Persistent map from (image content digest, backbone model id) to the
+    full-dimension, L2-normalized float32 embedding of that image. Backed by
+    a WAL-mode SQLite file, so several processes (API workers, scripts) can
+    read and write it concurrently. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str = IMAGE_CACHE_PATH, enabled: bool = IMAGE_CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_embedding ("
+                "digest TEXT NOT NULL, model_id TEXT NOT NULL, dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (digest, model_id))"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, digest: str, model_id: str) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        row = self._conn().execute(
+            "SELECT dim, vector FROM image_embedding WHERE digest = ? AND model_id = ?", (digest, model_id)
+        ).fetchone()
+        if row is None:
+            return None
+        dim, blob = row
+        return np.frombuffer(blob, dtype=np.float32, count=dim).copy()
+
+    def put(self, digest: str, model_id: str, vector: np.ndarray):
+        self.put_many([(digest, vector)], model_id)
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]], model_id: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = []
+        for digest, vector in items:
+            vector = np.ascontiguousarray(vector, dtype=np.float32).ravel()
+            rows.append((digest, model_id, vector.size, vector.tobytes(), now))
+        if not rows:
+            return
+        conn = self._conn()
+        conn.executemany("INSERT OR REPLACE INTO image_embedding VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+
+    def count(self, model_id: Optional[str] = None) -> int:
+        if not self.enabled or not os.path.exists(self.path):
+            return 0
+        if model_id is None:
+            return self._conn().execute("SELECT COUNT(*) FROM image_embedding").fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM image_embedding WHERE model_id = ?", (model_id,)).fetchone()[0]
+
+
+image_embedding_cache = ImageEmbeddingCache()
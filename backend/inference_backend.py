@@ -0,0 +1,203 @@
+import os
+import copy
+import glob
+import time
+import argparse
+import torch
+import torch.nn as nn
+from PIL import Image
+from typing import Callable, Optional
+
+# Inference Backend Configuration - Configurable via .env
+# ML_INFERENCE_BACKEND: "eager", "torchscript" (traced + frozen), "compile" (torch.compile)
+# or "int8" (post-training static quantization, CPU only)
+INFERENCE_BACKEND = os.getenv("ML_INFERENCE_BACKEND", "eager")
+# NHWC activations let the CPU convolution kernels vectorize better
+CHANNELS_LAST = os.getenv("ML_CHANNELS_LAST", "on").lower() != "off"
+# Intra-op threads per API worker process (0 = split the cores across WEB_CONCURRENCY workers)
+TORCH_THREADS = int(os.getenv("ML_TORCH_THREADS", "0"))
+# Inter-op threads; batches already run one at a time on the micro-batcher thread
+TORCH_INTEROP_THREADS = int(os.getenv("ML_TORCH_INTEROP_THREADS", "1"))
+# Images used to calibrate int8 activation ranges and to check optimized backends
+CALIBRATION_DIR = os.getenv("ML_CALIBRATION_DIR", os.path.join(os.getenv("DATASET_PATH", ""), "images"))
+CALIBRATION_SIZE = int(os.getenv("ML_CALIBRATION_SIZE", "64"))
+# Further images of the same directory, never seen by calibration, that optimized backends are checked on
+VALIDATION_SIZE = int(os.getenv("ML_VALIDATION_SIZE", "32"))
+# Minimum cosine similarity to the eager embeddings; below it the eager model is used
+MIN_COSINE = {"int8": float(os.getenv("ML_INT8_MIN_COSINE", "0.98"))}
+DEFAULT_MIN_COSINE = float(os.getenv("ML_BACKEND_MIN_COSINE", "0.999"))
+
+BACKENDS = ("eager", "torchscript", "compile", "int8")
+
+
+def configure_threads(threads: int = TORCH_THREADS, interop_threads: int = TORCH_INTEROP_THREADS):
+    if threads <= 0:
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
+
+
+class InferenceEngine:
+    """
+    Callable wrapper around an (optionally optimized) feature extractor.
+    Takes a float32 NCHW batch and returns (batch, features) on the CPU.
+    """
+
+    def __init__(self, model: Callable, name: str, device, channels_last: bool = False):
+        self.model = model
+        self.name = name
+        self.device = device
+        self.channels_last = channels_last
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        batch = batch.to(self.device)
+        # The preprocessor already produces channels-last tensors; this only copies when the layout differs
+        batch = batch.contiguous(memory_format=torch.channels_last if self.channels_last else torch.contiguous_format)
+        with torch.inference_mode():
+            features = self.model(batch)
+        return features.reshape(features.size(0), -1).float().cpu()
+
+
+def load_calibration_batch(transform, directory: str = CALIBRATION_DIR, size: int = CALIBRATION_SIZE,
+                           offset: int = 0) -> Optional[torch.Tensor]:
+    """
+    Preprocessed batch of `size` catalog images, skipping the first `offset`
+    (in name order), or None if the directory has none there.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")))[offset:offset + size] if directory else []
+    tensors = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                tensors.append(transform(img.convert('RGB')))
+        except OSError:
+            continue
+    return torch.stack(tensors) if tensors else None
+
+
+def _trace(model: nn.Module, example: torch.Tensor):
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+def _quantize_int8(model: nn.Module, calibration: torch.Tensor) -> nn.Module:
+    # Dynamic quantization only covers Linear/LSTM layers, and the headless ResNet50
+    # is all convolutions, so weights and activations are quantized statically
+    # with FX graph mode using ranges observed on calibration images.
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engines = torch.backends.quantized.supported_engines
+    engine = "x86" if "x86" in engines else ("fbgemm" if "fbgemm" in engines else "qnnpack")
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model).cpu().eval(), get_default_qconfig_mapping(engine), (calibration[:1],))
+    with torch.inference_mode():
+        for start in range(0, len(calibration), 16):
+            prepared(calibration[start:start + 16])
+    return convert_fx(prepared)
+
+
+def min_cosine(reference: torch.Tensor, candidate: torch.Tensor) -> float:
+    return float(nn.functional.cosine_similarity(reference, candidate, dim=1).min())
+
+
+def create_engine(model: nn.Module, device, transform, backend: str = INFERENCE_BACKEND,
+                  channels_last: bool = CHANNELS_LAST) -> InferenceEngine:
+    """
+    Wraps the eager model in the requested backend. Optimized backends are
+    checked against the eager embeddings on held-out validation images (int8
+    requires them; the others fall back to the calibration images, or random
+    inputs if none are available); if they drift past the cosine tolerance,
+    or fail to build, the eager model is used instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ML_INFERENCE_BACKEND '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    configure_threads()
+    if backend == "eager":
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return InferenceEngine(model, "eager", device, channels_last)
+    eager = InferenceEngine(model, "eager", device)
+    if backend == "int8" and device.type != "cpu":
+        print("⚠️  int8 inference is CPU only, using the eager model.")
+        return eager
+
+    calibration = load_calibration_batch(transform)
+    if calibration is None:
+        if backend == "int8":
+            print(f"⚠️  No calibration images in '{CALIBRATION_DIR}' (ML_CALIBRATION_DIR), using the eager model.")
+            return eager
+        calibration = torch.randn(8, 3, 224, 224, generator=torch.Generator().manual_seed(0))
+    # int8 activation ranges are fitted to the calibration images, so they are not a fair check
+    validation = load_calibration_batch(transform, size=VALIDATION_SIZE, offset=CALIBRATION_SIZE)
+    if validation is None:
+        if backend == "int8":
+            print(f"⚠️  No validation images in '{CALIBRATION_DIR}' beyond the {CALIBRATION_SIZE} calibration images "
+                  f"(ML_VALIDATION_SIZE), using the eager model.")
+            return eager
+        validation = calibration
+
+    start = time.perf_counter()
+    try:
+        if backend == "int8":
+            # Quantized kernels expect contiguous NCHW input
+            channels_last = False
+            optimized = _quantize_int8(model, calibration)
+        else:
+            optimized = model.to(memory_format=torch.channels_last) if channels_last else model
+            example = calibration[:1].to(device)
+            if channels_last:
+                example = example.contiguous(memory_format=torch.channels_last)
+            optimized = _trace(optimized, example) if backend == "torchscript" else torch.compile(optimized)
+        engine = InferenceEngine(optimized, backend, device if backend != "int8" else torch.device("cpu"), channels_last)
+        # The first calls also trigger compilation / profiling for compiled backends
+        similarity = min_cosine(eager(validation), engine(validation))
+    except Exception as e:
+        print(f"⚠️  Could not build the {backend} inference backend ({e}), using the eager model.")
+        return InferenceEngine(model.to(memory_format=torch.contiguous_format), "eager", device)
+
+    tolerance = MIN_COSINE.get(backend, DEFAULT_MIN_COSINE)
+    if similarity < tolerance:
+        print(f"⚠️  {backend} embeddings drift from eager (min cosine {similarity:.4f} < {tolerance}), using the eager model.")
+        return InferenceEngine(model.to(memory_format=torch.contiguous_format), "eager", device)
+    print(f"⚡ Using {backend} inference backend (min cosine vs eager {similarity:.4f}, "
+          f"channels_last={channels_last}, {torch.get_num_threads()} threads, built in {time.perf_counter() - start:.1f}s)")
+    return engine
+
+
+def benchmark(engine: InferenceEngine, batch: torch.Tensor, repeats: int = 10) -> float:
+    """Mean milliseconds per image."""
+    engine(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        engine(batch)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(batch))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare inference backends for the feature extractor.")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--batch-sizes", default="1,16")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    from ml_service import ml_service
+    ml_service._ensure_initialized()
+    eager_model = ml_service._build_model(ml_service.device)
+    inputs = load_calibration_batch(ml_service.transform)
+    if inputs is None:
+        inputs = torch.randn(16, 3, 224, 224)
+    for name in args.backends.split(","):
+        engine = create_engine(copy.deepcopy(eager_model), ml_service.device, ml_service.transform, backend=name)
+        if engine.name != name:
+            continue
+        timings = "  ".join(f"batch {bs}: {benchmark(engine, inputs[:bs], args.repeats):.1f} ms/img"
+                            for bs in map(int, args.batch_sizes.split(",")))
+        print(f"{name:12s} {timings}")
@@ -0,0 +1,52 @@
+import os
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Inference Pool Configuration - Configurable via .env
+# Threads for decoding, preprocessing and similarity search (NumPy/PIL/Torch release the GIL)
+POOL_WORKERS = int(os.getenv("ML_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Requests allowed to wait beyond the running ones before new work is rejected with 429
+POOL_MAX_QUEUE = int(os.getenv("ML_POOL_MAX_QUEUE", "32"))
+
+
+class InferencePool:
+    """
+    Bounded thread pool that keeps CPU-bound ML work off the asyncio event
+    loop. Admission is counted per request: once `workers + max_queue`
+    requests are in flight, try_acquire() fails so callers can shed load
+    instead of queueing without limit.
+    """
+
+    def __init__(self, workers: int = POOL_WORKERS, max_queue: int = POOL_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ml-pool")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the pool and awaits the result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+inference_pool = InferencePool()
@@ -0,0 +1,12 @@
+import math
+
+
+def sanitize_value(v):
+    """Recursively replaces NaN with None for JSON compatibility."""
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    if isinstance(v, dict):
+        return {k: sanitize_value(val) for k, val in v.items()}
+    if isinstance(v, list):
+        return [sanitize_value(val) for val in v]
+    return v
@@ -1,5 +1,6 @@
+import asyncio
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api import products, search
 from database import init_db
@@ -30,6 +31,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the shop page read the /products pagination cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
 if os.path.exists(DATASET_IMAGES_PATH) and os.path.isdir(DATASET_IMAGES_PATH):
@@ -47,40 +50,20 @@ else:
 async def on_startup():
     await init_db()
     
-    # Sync ML Service Cache
-    from database import get_session
-    from models import Product
-    from sqlmodel import select
-    from ml_service import ml_service
-    
-    print("🚀 Initializing ML Cache...")
-    try:
-        from sqlmodel import func
-        async for session in get_session():
-            # Get total count first
-            count_stmt = select(func.count(Product.id)).where(Product.embedding != None)
-            total_count = (await session.execute(count_stmt)).scalar() or 0
-            print(f"📦 Total products to cache: {total_count}")
-            
-            batch_size = 1000
-            all_product_data = []
-            
-            for offset in range(0, total_count, batch_size):
-                print(f"➡️ Fetching batch: {offset} to {min(offset + batch_size, total_count)}...")
-                # Fetch only ID and Embedding to save bandwidth/memory
-                batch_stmt = select(Product.id, Product.embedding).where(Product.embedding != None).offset(offset).limit(batch_size)
-                result = await session.execute(batch_stmt)
-                batch_rows = result.all()
-                all_product_data.extend([{"id": r[0], "embedding": r[1]} for r in batch_rows])
-            
-            ml_service.sync_cache(all_product_data)
-            break
-    except Exception as e:
-        print(f"❌ Error during ML Cache Init: {e}")
-        import traceback
-        traceback.print_exc()
+    # Warm the ML Service (model + embedding cache) in the background so the
+    # API accepts traffic immediately; /health/ready reports when it is done.
+    from cache_warmup import warm_up
+    app.state.warmup_task = asyncio.create_task(warm_up())
     
-    print("✨ API and ML Service ready.")
+    print("✨ API ready. ML Service warming up in the background.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    task = getattr(app.state, "warmup_task", None)
+    if task and not task.done():
+        task.cancel()
+    from inference_pool import inference_pool
+    inference_pool.shutdown()
 
 app.include_router(products.router)
 app.include_router(search.router)
@@ -92,3 +75,23 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    from ml_service import ml_service
+    from inference_pool import inference_pool
+    from query_cache import query_cache
+    import pgvector_backend
+    status = {
+        "status": "ready" if ml_service.is_ready else "warming",
+        "model_loaded": ml_service.model_ready,
+        "cache_loaded": ml_service.cache_ready,
+        "cached_products": len(ml_service.index),
+        "vector_backend": "pgvector" if pgvector_backend.ACTIVE else "memory",
+        "inference_in_flight": inference_pool.in_flight,
+        "inference_rejected": inference_pool.rejected,
+        "query_cache": query_cache.stats(),
+    }
+    if not ml_service.is_ready:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "5"})
+    return status
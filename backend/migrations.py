@@ -0,0 +1,187 @@
+import json
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from models import MATERIALIZED_ATTRIBUTES
+from json_utils import sanitize_value
+
+# Lightweight, idempotent schema migrations for columns added after the
+# initial create_all. Each migration inspects the live schema first, so they
+# are safe to run on every startup against both SQLite and Postgres.
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn: Connection, table: str) -> set:
+    return {i["name"] for i in inspect(conn).get_indexes(table)}
+
+
+def _triggers(conn: Connection) -> set:
+    if conn.dialect.name == "postgresql":
+        return set(conn.execute(text("SELECT tgname FROM pg_trigger WHERE tgrelid = 'product'::regclass")).scalars())
+    return set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'product'")).scalars())
+
+
+def _timestamp_type(conn: Connection) -> str:
+    return "TIMESTAMP WITHOUT TIME ZONE" if conn.dialect.name == "postgresql" else "DATETIME"
+
+
+def add_product_updated_at(conn: Connection):
+    if "updated_at" not in _columns(conn, "product"):
+        print("🛠️  Migrating: adding product.updated_at")
+        conn.execute(text(f"ALTER TABLE product ADD COLUMN updated_at {_timestamp_type(conn)}"))
+        conn.execute(text("UPDATE product SET updated_at = created_at WHERE updated_at IS NULL"))
+    if "ix_product_updated_at" not in _indexes(conn, "product"):
+        conn.execute(text("CREATE INDEX ix_product_updated_at ON product (updated_at)"))
+
+
+TIMESTAMP_TRIGGER = "product_timestamps"
+# SQLite keeps DATETIME as text and compares it as a string. SQLAlchemy binds
+# 'YYYY-MM-DD HH:MM:SS.ffffff', while raw writers (seed scripts: datetime('now'))
+# store 'YYYY-MM-DD HH:MM:SS', which sorts before every fractional value of the
+# same second, so keyset cursors and delta polls would skip or repeat rows.
+
+
+def _full_precision(column: str) -> str:
+    return (f"CASE length({column}) WHEN 19 THEN {column} || '.000000' "
+            f"WHEN 23 THEN {column} || '000' ELSE {column} END")
+
+
+def normalize_product_timestamps(conn: Connection):
+    """Rewrites product.created_at/updated_at to microsecond precision on SQLite, now and on every later write."""
+    if conn.dialect.name != "sqlite":
+        return
+    if {f"{TIMESTAMP_TRIGGER}_insert", f"{TIMESTAMP_TRIGGER}_update"} <= _triggers(conn):
+        return
+    fixed = conn.execute(text(
+        f"UPDATE product SET created_at = {_full_precision('created_at')}, updated_at = {_full_precision('updated_at')} "
+        f"WHERE length(created_at) IN (19, 23) OR length(updated_at) IN (19, 23)"
+    )).rowcount
+    if fixed:
+        print(f"🛠️  Migrating: normalized timestamps of {fixed} products to microsecond precision")
+    short = "length(NEW.created_at) IN (19, 23) OR length(NEW.updated_at) IN (19, 23)"
+    for event in ("insert", "update"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {TIMESTAMP_TRIGGER}_{event}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {TIMESTAMP_TRIGGER}_{event} "
+            f"AFTER {'INSERT' if event == 'insert' else 'UPDATE OF created_at, updated_at'} ON product "
+            f"WHEN {short} BEGIN UPDATE product SET created_at = {_full_precision('created_at')}, "
+            f"updated_at = {_full_precision('updated_at')} WHERE id = NEW.id; END"
+        ))
+
+
+def add_product_embedding_model(conn: Connection):
+    if "embedding_model" not in _columns(conn, "product"):
+        print("🛠️  Migrating: adding product.embedding_model")
+        conn.execute(text("ALTER TABLE product ADD COLUMN embedding_model VARCHAR"))
+        # Every embedding written before backbones were configurable came from ResNet50.
+        # '[]' is the seed scripts' "not embedded yet" placeholder and stays untagged.
+        conn.execute(text("UPDATE product SET embedding_model = 'resnet50:IMAGENET1K_V1:224' "
+                          "WHERE embedding IS NOT NULL AND CAST(embedding AS TEXT) NOT IN ('', '[]', 'null') "
+                          "AND embedding_model IS NULL"))
+    if "ix_product_embedding_model" not in _indexes(conn, "product"):
+        conn.execute(text("CREATE INDEX ix_product_embedding_model ON product (embedding_model)"))
+
+
+ATTRIBUTE_TRIGGER = "product_attribute_columns"
+
+
+def _repair_sqlite_attributes(conn: Connection):
+    # Seeded rows may hold pandas NaN, which SQLite's JSON functions reject as malformed
+    rows = conn.execute(text("SELECT id, attributes FROM product WHERE attributes IS NOT NULL AND NOT json_valid(attributes)")).all()
+    for pid, raw in rows:
+        try:
+            fixed = json.dumps(sanitize_value(json.loads(raw)))
+        except ValueError:
+            continue
+        conn.execute(text("UPDATE product SET attributes = :a WHERE id = :id"), {"a": fixed, "id": pid})
+    if rows:
+        print(f"🛠️  Migrating: repaired non-standard JSON (NaN) in {len(rows)} product.attributes")
+
+
+def add_product_attribute_columns(conn: Connection):
+    """
+    Materializes MATERIALIZED_ATTRIBUTES as lower-cased, indexed columns so
+    catalog filters are index range scans instead of json_extract scans.
+    Triggers copy them from `attributes` on every INSERT and every UPDATE of
+    attributes, whichever writer (ORM, seed scripts, migrations) made it.
+    """
+    postgres = conn.dialect.name == "postgresql"
+    columns = _columns(conn, "product")
+    for column in MATERIALIZED_ATTRIBUTES:
+        if column not in columns:
+            print(f"🛠️  Migrating: adding product.{column}")
+            conn.execute(text(f"ALTER TABLE product ADD COLUMN {column} VARCHAR"))
+    indexes = _indexes(conn, "product")
+    for column in MATERIALIZED_ATTRIBUTES:
+        if f"ix_product_{column}" not in indexes:
+            conn.execute(text(f"CREATE INDEX ix_product_{column} ON product ({column})"))
+
+    triggers = _triggers(conn)
+    if postgres:
+        if ATTRIBUTE_TRIGGER in triggers:
+            return
+        assignments = " ".join(f"NEW.{column} = lower(NEW.attributes ->> '{key}');"
+                               for column, key in MATERIALIZED_ATTRIBUTES.items())
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {ATTRIBUTE_TRIGGER}() RETURNS trigger AS $$ BEGIN "
+            f"{assignments} RETURN NEW; END $$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {ATTRIBUTE_TRIGGER} BEFORE INSERT OR UPDATE OF attributes ON product "
+            f"FOR EACH ROW EXECUTE FUNCTION {ATTRIBUTE_TRIGGER}()"
+        ))
+        backfill = ", ".join(f"{column} = lower(attributes ->> '{key}')" for column, key in MATERIALIZED_ATTRIBUTES.items())
+        print("🛠️  Migrating: backfilling materialized attribute columns")
+        conn.execute(text(f"UPDATE product SET {backfill}"))
+        return
+
+    if {f"{ATTRIBUTE_TRIGGER}_insert", f"{ATTRIBUTE_TRIGGER}_update"} <= triggers:
+        return
+    _repair_sqlite_attributes(conn)
+
+    def assignments(source: str) -> str:
+        return ", ".join(f"{column} = CASE WHEN json_valid({source}) THEN lower(json_extract({source}, '$.{key}')) END"
+                         for column, key in MATERIALIZED_ATTRIBUTES.items())
+
+    # SQLite triggers cannot modify NEW, so they update the row just written
+    for event in ("insert", "update"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {ATTRIBUTE_TRIGGER}_{event}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {ATTRIBUTE_TRIGGER}_{event} AFTER {'INSERT' if event == 'insert' else 'UPDATE OF attributes'} "
+            f"ON product BEGIN UPDATE product SET {assignments('NEW.attributes')} WHERE id = NEW.id; END"
+        ))
+    print("🛠️  Migrating: backfilling materialized attribute columns")
+    conn.execute(text(f"UPDATE product SET {assignments('attributes')}"))
+
+
+def add_product_search_index(conn: Connection):
+    # FTS5 table on SQLite, generated tsvector + GIN on Postgres
+    import text_search
+    text_search.migrate(conn)
+
+
+def add_product_embedding_vector(conn: Connection):
+    # Optional pgvector column (ML_VECTOR_BACKEND=pgvector); SQLite keeps the in-memory index
+    if conn.dialect.name != "postgresql":
+        return
+    import pgvector_backend
+    if pgvector_backend.is_active(conn.dialect.name):
+        pgvector_backend.migrate(conn)
+
+
+MIGRATIONS = [
+    add_product_updated_at,
+    normalize_product_timestamps,
+    add_product_embedding_model,
+    add_product_attribute_columns,
+    add_product_search_index,
+    add_product_embedding_vector,
+]
+
+
+def run_migrations(conn: Connection):
+    """Applies every pending migration. Called from database.init_db via run_sync."""
+    for migration in MIGRATIONS:
+        migration(conn)
@@ -1,27 +1,26 @@
 
 import os
 import torch
-import torch.nn as nn
-import torchvision.models as models
-import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
 from numpy.linalg import norm
-from sklearn.neighbors import NearestNeighbors
 import cv2
-from typing import List, Tuple
-import io
-import math
-
-def sanitize_value(v):
-    """Recursively replaces NaN with None for JSON compatibility."""
-    if isinstance(v, float) and math.isnan(v):
-        return None
-    if isinstance(v, dict):
-        return {k: sanitize_value(val) for k, val in v.items()}
-    if isinstance(v, list):
-        return [sanitize_value(val) for val in v]
-    return v
+from typing import List, Tuple, Optional, Union
+import copy
+import threading
+from datetime import datetime
+from functools import partial
+from concurrent.futures import Future
+from vector_index import ExactIndex, create_index, normalize_rows
+from dim_reduction import PCAProjection
+import embedding_store
+from inference_batcher import MicroBatcher
+from inference_backend import create_engine
+from backbones import get_backbone
+from preprocess import Preprocessor, decode_image
+from recommendation_table import RecommendationTable, RECS_PATH
+from attribute_filter import CatalogAttributes
+from json_utils import sanitize_value
 
 class MLService:
     _instance = None
@@ -31,122 +30,282 @@ class MLService:
             cls._instance = super(MLService, cls).__new__(cls)
             cls._instance.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
             cls._instance.model = None
+            # Feature extractor architecture (ML_BACKBONE); its model_id tags every stored embedding
+            cls._instance.backbone = get_backbone()
+            cls._instance.model_id = cls._instance.backbone.model_id
             cls._instance.transform = None
-            cls._instance.product_cache = [] # In-memory cache
+            cls._instance.preprocessor = None
+            # Readiness flags flipped by the background warm-up (see cache_warmup.warm_up)
+            cls._instance.model_ready = False
+            cls._instance.cache_ready = False
+            cls._instance._init_lock = threading.Lock()
+            # Serializes incremental index updates (searches never take it)
+            cls._instance._index_lock = threading.Lock()
+            # Latest product.updated_at reflected in the index; delta polls resume from here
+            cls._instance.high_water = None
+            # Product rows with a non-NULL embedding (and the sum of their ids) when the index was last reconciled
+            cls._instance.source_rows = 0
+            cls._instance.source_id_sum = 0
+            # Coalesces concurrent image-search requests into extract_features_batch calls.
+            # Rows stay full-dimension (cacheable by image digest); searches project the query.
+            cls._instance.batcher = MicroBatcher(partial(cls._instance.extract_features_batch, project=False))
+            # Similarity index over a contiguous, L2-normalized (N, D) float32 matrix.
+            # Built once in sync_cache; exact or approximate depending on ML_INDEX_TYPE.
+            cls._instance.index = ExactIndex()
+            # Bumped whenever self.index is replaced, so cached search results can detect staleness
+            cls._instance.index_version = 0
+            # Optional PCA projection fitted by generate_embeddings.py (None = full dimension)
+            cls._instance.projection = PCAProjection.load()
+            if cls._instance.projection is not None:
+                p = cls._instance.projection
+                print(f"📉 Using PCA projection {p.input_dim} -> {p.output_dim} dims (whiten={p.whiten})")
+            # Filterable attributes (category, price, gender, articleType) of the indexed products,
+            # loaded by the warm-up and kept current by the delta poll
+            cls._instance.attributes = CatalogAttributes()
+            # Optional precomputed neighbour lists built by recommendation_table.py
+            cls._instance.recommendations = RecommendationTable.load(model_id=cls._instance.model_id)
+            # mtime of the last table file considered, so a rejected file is not reloaded every poll
+            cls._instance.recommendations_mtime = cls._instance.recommendations.mtime if cls._instance.recommendations else 0.0
         return cls._instance
 
     def _ensure_initialized(self):
         if self.model is None:
-            self.model = self._build_model(self.device)
-            self.transform = transforms.Compose([
-                transforms.Resize((224, 224)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ])
+            with self._init_lock:
+                if self.model is None:
+                    # torchvision transform for single images (calibration, scripts);
+                    # batches go through the vectorized preprocessor
+                    self.transform = self.backbone.transform()
+                    self.preprocessor = Preprocessor(self.backbone.input_size)
+                    # Eager backbone wrapped in the ML_INFERENCE_BACKEND engine (TorchScript, int8, ...)
+                    self.model = create_engine(self._build_model(self.device), self.device, self.transform)
+                    self.model_ready = True
 
-    @staticmethod
-    def _build_model(device):
-        print(f"Loading ResNet50 model on {device}...")
-        # Load prep-trained ResNet50
-        model = models.resnet50(pretrained=True)
-        # Remove the classification head (fc layer)
-        # ResNet50 output before fc is (batch, 2048, 7, 7)
-        # We want the Global Average Pool output (batch, 2048)
-        model = nn.Sequential(*list(model.children())[:-1])
-        model.to(device)
-        model.eval()
-        print("Model loaded successfully.")
-        return model
-
-    def extract_features(self, img: Image.Image) -> List[float]:
+    @property
+    def is_ready(self) -> bool:
+        """True once both the model and the embedding cache are loaded."""
+        return self.model_ready and self.cache_ready
+
+    def _build_model(self, device):
+        return self.backbone.build(device)
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Applies the PCA projection to full-dimension embeddings. Vectors that are
+        already reduced (or when no projection is fitted) pass through unchanged.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.projection is None or vectors.size == 0 or vectors.shape[-1] != self.projection.input_dim:
+            return vectors
+        return self.projection.transform(vectors)
+
+    def extract_features(self, img: Image.Image, project: bool = True) -> List[float]:
         self._ensure_initialized()
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        img_tensor = self.transform(img).unsqueeze(0).to(self.device)
+        img_tensor = self.preprocessor.batch([img])
         
         with torch.no_grad():
             features = self.model(img_tensor)
-            features = features.view(features.size(0), -1)
-            features = features.cpu().numpy().flatten()
+            features = features.numpy().flatten()
             
         normalized_features = features / (norm(features) + 1e-7)
+        if project:
+            normalized_features = self.project(normalized_features)
         return normalized_features.tolist()
 
-    def extract_features_batch(self, imgs: List[Image.Image]) -> np.ndarray:
+    def extract_features_batch(self, imgs: List[Image.Image], project: bool = True) -> np.ndarray:
         self._ensure_initialized()
-        tensors = []
-        for img in imgs:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            tensors.append(self.transform(img))
-        
-        if not tensors:
+        if not imgs:
             return np.array([])
 
-        batch_tensor = torch.stack(tensors).to(self.device)
+        # One vectorized uint8 -> normalized float32 pass over the whole batch
+        batch_tensor = self.preprocessor.batch(imgs)
         
         with torch.no_grad():
             features = self.model(batch_tensor)
-            features = features.view(features.size(0), -1)
-            features = features.cpu().numpy()
+            features = features.numpy()
             
         # Normalize batch
         norms = norm(features, axis=1, keepdims=True)
         normalized_features = features / (norms + 1e-7)
+        if project:
+            normalized_features = self.project(normalized_features)
         return normalized_features
 
-    def extract_features_from_bytes(self, image_bytes: bytes) -> List[float]:
-        try:
-            img = Image.open(io.BytesIO(image_bytes))
-            return self.extract_features(img)
-        except Exception as e:
-            print(f"Error extracting features from bytes: {e}")
-            return []
+    def load_image(self, source: Union[bytes, str]) -> Image.Image:
+        """
+        Decodes uploaded bytes (or an image file path) into an RGB image already
+        at the model input size, using JPEG draft mode (raises on invalid data).
+        """
+        return decode_image(source, self.backbone.input_size)
 
-    def find_similar_products(self, query_embedding: List[float], products_data: List[dict] = None, k: int = 24) -> List[Tuple[int, float]]:
+    def submit_features(self, img: Image.Image) -> Future:
         """
-        Finds similar products. Uses product_cache if products_data is None.
+        Queues one image for batched inference. The returned Future resolves to
+        its normalized full-dimension embedding row once the micro-batch runs.
         """
-        # Prioritize provided data, fallback to cache
-        search_data = products_data if products_data is not None else self.product_cache
-        
-        if not search_data:
-            print("WARNING: No product data available for similarity search.")
-            return []
+        return self.batcher.submit(img)
 
-        # Filter out products without embeddings
-        valid_products = [p for p in search_data if p.get('embedding') and len(p['embedding']) > 0]
-        
+    @staticmethod
+    def _build_matrix(products_data: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Packs product dicts into an (ids, matrix) pair. Rows are float32 and
+        L2-normalized so cosine similarity reduces to a dot product.
+        """
+        valid_products = [p for p in products_data if p.get('embedding') and len(p['embedding']) > 0]
         if not valid_products:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+        ids = np.fromiter((p['id'] for p in valid_products), dtype=np.int64, count=len(valid_products))
+        matrix = normalize_rows(np.array([p['embedding'] for p in valid_products], dtype=np.float32))
+        return ids, np.ascontiguousarray(matrix)
+
+    def find_similar_products(self, query_embedding: List[float], products_data: List[dict] = None, k: int = 24,
+                              filters: Optional[dict] = None) -> List[Tuple[int, float]]:
+        """
+        Finds similar products. Uses the cached index if products_data is None.
+        filters (category_id, gender, sub_category, min_price, max_price) restrict
+        the cached index to matching products before the top-k selection.
+        """
+        allowed = None
+        if products_data is not None:
+            ids, matrix = self._build_matrix(products_data)
+            index = ExactIndex()
+            index.build(ids, self.project(matrix))
+        else:
+            index = self.index
+            allowed = self.attributes.mask(index.ids, filters)
+
+        if len(index) == 0:
+            print("WARNING: No product data available for similarity search.")
             return []
 
-        feature_list = np.array([p['embedding'] for p in valid_products], dtype=np.float32)
-        product_ids = [p['id'] for p in valid_products]
-        
-        query_vec = np.array([query_embedding], dtype=np.float32)
-        
-        if len(feature_list) < k:
-            k = len(feature_list)
+        query_vec = self.project(normalize_rows(np.asarray(query_embedding, dtype=np.float32).ravel()))
+        ids, similarities = index.search(query_vec, k, allowed=allowed)
 
-        # Efficient brute-force cosine similarity using sklearn
-        neighbors = NearestNeighbors(n_neighbors=k, algorithm='brute', metric='cosine')
-        neighbors.fit(feature_list)
-        
-        distances, indices = neighbors.kneighbors(query_vec)
-        
         results = []
-        for i, idx in enumerate(indices[0]):
-            similarity = 1 - distances[0][i]
-            score = max(0, similarity * 100)
-            results.append((product_ids[idx], round(score, 1)))
-            
+        for pid, similarity in zip(ids.tolist(), similarities.tolist()):
+            score = max(0.0, similarity * 100)
+            results.append((pid, round(score, 1)))
+
         return results
 
-    def sync_cache(self, all_products: List[dict]):
-        """Updates the in-memory embedding cache."""
+    def recommend(self, product_id: int, limit: int) -> Optional[List[int]]:
+        """Precomputed neighbours of a product, or None when the live index must be searched."""
+        table = self.recommendations
+        return table.lookup(product_id, limit) if table is not None else None
+
+    def reload_recommendations(self) -> bool:
+        """Picks up a recommendation table rebuilt since it was last loaded."""
+        try:
+            mtime = os.path.getmtime(RECS_PATH)
+        except OSError:
+            return False
+        if self.recommendations_mtime >= mtime:
+            return False
+        self.recommendations_mtime = mtime
+        table = RecommendationTable.load(model_id=self.model_id)
+        if table is None:
+            return False
+        self.recommendations = table
+        return True
+
+    def _install_index(self, ids: np.ndarray, matrix: np.ndarray, source: str):
+        # Stored embeddings are full-dimension; reduce them to match query vectors
+        matrix = self.project(matrix)
+        index = create_index(len(ids))
+        index.build(ids, matrix)
+        self.index = index
+        self.index_version += 1
+        print(f"✅ ML Cache synchronization complete from {source} ({len(index)} x {index.dim}, {index.name} index, "
+              f"{index.codec.name} storage, {index.memory_bytes() / 1e6:.1f} MB).")
+
+    def sync_cache(self, all_products: List[dict], persist: bool = False):
+        """
+        Rebuilds the in-memory similarity index from (id, embedding) dicts.
+        With persist=True the matrix is also written to the on-disk embedding store.
+        """
         print(f"🔄 Syncing {len(all_products)} products to ML cache...")
-        self.product_cache = all_products
-        print("✅ ML Cache synchronization complete.")
+        ids, matrix = self._build_matrix(all_products)
+        self.sync_matrix(ids, matrix, source_rows=len(all_products),
+                         source_id_sum=sum(int(p['id']) for p in all_products), persist=persist)
+
+    def sync_matrix(self, ids: np.ndarray, matrix: np.ndarray, source_rows: Optional[int] = None,
+                    persist: bool = False, high_water: Optional[datetime] = None,
+                    source_id_sum: Optional[int] = None):
+        """Rebuilds the index from an already packed, L2-normalized (ids, matrix) pair."""
+        if persist and len(ids) and embedding_store.STORE_ENABLED:
+            embedding_store.write_store(ids, matrix, source_rows=source_rows, high_water=high_water,
+                                        model_id=self.model_id, source_id_sum=source_id_sum)
+        self._install_index(ids, matrix, "database")
+        self.high_water = high_water
+        self.source_rows = source_rows if source_rows is not None else len(ids)
+        self.source_id_sum = source_id_sum if source_id_sum is not None else int(np.sum(ids))
+        if self.recommendations is not None and not self.recommendations.matches(self.model_id, self.source_rows,
+                                                                                  self.source_id_sum):
+            # Built from an export the database has since moved away from
+            print("⚠️  Recommendation table does not match the database. Using live index search until it is rebuilt.")
+            self.recommendations = None
+
+    def load_from_store(self, expected_rows: Optional[int] = None, expected_id_sum: Optional[int] = None) -> bool:
+        """
+        Builds the index from the memory-mapped embedding store. With the default
+        float32 exact index and no PCA the mapped file is searched in place.
+        Returns False if there is no usable store or it is stale, i.e. it was
+        exported from a different number of embedded rows than expected_rows,
+        a different id sum than expected_id_sum, or by a different backbone.
+        Changes made after the export are picked up by the delta poll, which
+        resumes from the store's high-water mark.
+        """
+        loaded = embedding_store.load_store()
+        if loaded is None:
+            return False
+        ids, matrix, manifest = loaded
+        if manifest["model"] != self.model_id:
+            print(f"⚠️  Embedding store {manifest['version']} holds {manifest['model']} embeddings, "
+                  f"serving {self.model_id}. Falling back to database warm-up.")
+            return False
+        if expected_rows is not None and manifest["source_rows"] != expected_rows:
+            print(f"⚠️  Embedding store {manifest['version']} was exported from {manifest['source_rows']} rows, "
+                  f"database has {expected_rows}. Falling back to database warm-up.")
+            return False
+        if expected_id_sum is not None and manifest.get("source_id_sum") != expected_id_sum:
+            print(f"⚠️  Embedding store {manifest['version']} was exported from other products than the database "
+                  f"now holds. Falling back to database warm-up.")
+            return False
+        self._install_index(ids, matrix, f"embedding store {manifest['version']}")
+        self.high_water = datetime.fromisoformat(manifest["high_water"]) if manifest.get("high_water") else None
+        self.source_rows = manifest["source_rows"]
+        self.source_id_sum = manifest.get("source_id_sum")
+        return True
+
+    def upsert_products(self, ids: np.ndarray, matrix: np.ndarray):
+        """
+        Adds or replaces products in the live index without a full rebuild.
+        The update is applied to a copy that is swapped in atomically, so
+        concurrent searches always see a consistent index.
+        """
+        if len(ids) == 0:
+            return
+        matrix = self.project(normalize_rows(matrix))
+        with self._index_lock:
+            index = copy.copy(self.index)
+            index.upsert(ids, matrix)
+            self.index = index
+            self.index_version += 1
+        if self.recommendations is not None:
+            self.recommendations.invalidate(ids)
+
+    def remove_products(self, ids: np.ndarray) -> int:
+        """Removes products from the live index. Returns how many were present."""
+        if len(ids) == 0:
+            return 0
+        with self._index_lock:
+            index = copy.copy(self.index)
+            removed = index.remove(ids)
+            if removed:
+                self.index = index
+                self.index_version += 1
+        if self.recommendations is not None:
+            self.recommendations.invalidate(ids)
+        return removed
 
 ml_service = MLService()
@@ -33,13 +33,47 @@ class ProductBase(SQLModel):
     is_new: bool = Field(default=False, index=True)
     image_urls: List[str] = Field(default=[], sa_column=Column(JSON))
     attributes: Dict = Field(default={}, sa_column=Column(JSON)) # For Amazon-like flexibility
-    embedding: List[float] = Field(default=[], sa_column=Column(JSON)) # For recommendation system
+
+# Hot `attributes` keys materialized as indexed columns: column -> JSON key.
+# Values are lower-cased copies kept in sync by database triggers (see migrations.py).
+MATERIALIZED_ATTRIBUTES = {
+    "gender": "gender",
+    "article_type": "articleType",
+    "base_colour": "baseColour",
+    "season": "season",
+    "usage": "usage",
+    # The dataset's subCategory (e.g. "Topwear"); the API's sub_category filter is the articleType
+    "category_group": "subCategory",
+}
 
 class Product(ProductBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     category_id: int = Field(foreign_key="category.id", index=True)
     category: Category = Relationship(back_populates="products")
+    # For recommendation system; internal, never part of an API response (see ProductRead)
+    embedding: List[float] = Field(default=[], sa_column=Column(JSON))
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    # Bumped on every ORM update; the ML cache polls it to pick up re-embedded products
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True, sa_column_kwargs={"onupdate": datetime.utcnow})
+    # Backbone that produced `embedding` (backbones.Backbone.model_id); other models' vectors are not comparable
+    embedding_model: Optional[str] = Field(default=None, index=True)
+    # Lower-cased copies of MATERIALIZED_ATTRIBUTES for indexed catalog filtering; never written directly
+    gender: Optional[str] = Field(default=None, index=True)
+    article_type: Optional[str] = Field(default=None, index=True)
+    base_colour: Optional[str] = Field(default=None, index=True)
+    season: Optional[str] = Field(default=None, index=True)
+    usage: Optional[str] = Field(default=None, index=True)
+    category_group: Optional[str] = Field(default=None, index=True)
+
+class ProductRead(ProductBase):
+    """Product as listed by the API: every public column, never the embedding."""
+    id: int
+    category_id: int
+    created_at: datetime
+
+class ProductDetail(ProductRead):
+    """Single-product response."""
+    updated_at: Optional[datetime] = None
 
 class CartItem(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
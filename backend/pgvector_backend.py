@@ -0,0 +1,189 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+from sqlmodel import select
+from sqlalchemy import Float, Text, cast, column, literal, literal_column, table, text
+from sqlalchemy.dialects.postgresql.base import ischema_names
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import UserDefinedType
+from models import Product
+from backbones import get_backbone
+from database import engine
+
+# pgvector Configuration - Configurable via .env
+# ML_VECTOR_BACKEND: "memory" (default, in-process index loaded by every worker) or
+# "pgvector" (Postgres only: product.embedding_vec + ANN index, searched by the database)
+VECTOR_BACKEND = os.getenv("ML_VECTOR_BACKEND", "memory").lower()
+# "hnsw" (default) or "ivfflat"
+PGVECTOR_INDEX = os.getenv("ML_PGVECTOR_INDEX", "hnsw").lower()
+HNSW_M = int(os.getenv("ML_PGVECTOR_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("ML_PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+# Candidate list size per query; must be >= k
+HNSW_EF_SEARCH = int(os.getenv("ML_PGVECTOR_HNSW_EF_SEARCH", "100"))
+# 0 = rows / 1000, the pgvector recommendation up to 1M rows
+IVF_LISTS = int(os.getenv("ML_PGVECTOR_IVF_LISTS", "0"))
+IVF_PROBES = int(os.getenv("ML_PGVECTOR_IVF_PROBES", "10"))
+# Keep scanning the index until k rows pass the filters (pgvector >= 0.8); "off" for older versions
+ITERATIVE_SCAN = os.getenv("ML_PGVECTOR_ITERATIVE_SCAN", "on").lower() != "off"
+# pgvector cannot index `vector` columns wider than this; wider embeddings (resnet50: 2048) use halfvec
+MAX_VECTOR_INDEX_DIM = 2000
+
+COLUMN = "embedding_vec"
+TRIGGER_FUNCTION = "product_embedding_vec_sync"
+
+
+class VectorType(UserDefinedType):
+    """Postgres `vector(dim)` / `halfvec(dim)`, exchanged with the database as its text form."""
+    cache_ok = True
+
+    def __init__(self, dim: Optional[int] = None, kind: str = "vector"):
+        self.dim = dim
+        self.kind = kind
+
+    def get_col_spec(self, **kw) -> str:
+        return f"{self.kind}({self.dim})" if self.dim else self.kind
+
+
+class HalfVectorType(VectorType):
+    cache_ok = True
+
+    def __init__(self, dim: Optional[int] = None):
+        super().__init__(dim, "halfvec")
+
+
+# Lets inspect(conn).get_columns() reflect the column instead of warning about an unknown type
+ischema_names["vector"] = VectorType
+ischema_names["halfvec"] = HalfVectorType
+
+
+def is_active(dialect_name: str) -> bool:
+    return VECTOR_BACKEND == "pgvector" and dialect_name == "postgresql"
+
+
+# Whether the API searches with pgvector instead of the in-memory index
+ACTIVE = is_active(engine.dialect.name)
+if VECTOR_BACKEND == "pgvector" and not ACTIVE:
+    print("⚠️  ML_VECTOR_BACKEND=pgvector needs the cloud (Postgres) database; using the in-memory index.")
+
+
+def vector_type(dim: Optional[int] = None) -> VectorType:
+    """Column type for embeddings of the configured backbone."""
+    dim = dim or get_backbone().dim
+    return VectorType(dim) if dim <= MAX_VECTOR_INDEX_DIM else HalfVectorType(dim)
+
+
+def vector_literal(vector: Sequence[float]) -> str:
+    return "[" + ",".join(f"{float(x):.7g}" for x in vector) + "]"
+
+
+def _index_name(method: str) -> str:
+    return f"ix_product_{COLUMN}_{method}"
+
+
+def migrate(conn: Connection):
+    """
+    Adds product.embedding_vec, backfills it from the JSON embedding column,
+    installs a trigger that keeps it in sync with every later write of
+    `embedding`, and builds the ANN index. Re-creates the column when the
+    backbone dimension changed. Idempotent; called from migrations.py.
+    """
+    vtype = vector_type()
+    spec = vtype.get_col_spec()
+    dim = vtype.dim
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
+    current = conn.execute(text(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = 'product'::regclass AND attname = :name AND NOT attisdropped"
+    ), {"name": COLUMN}).scalar()
+    if current is not None and current != spec:
+        print(f"🛠️  Migrating: product.{COLUMN} is {current}, backbone needs {spec}; re-creating it")
+        conn.execute(text(f"ALTER TABLE product DROP COLUMN {COLUMN}"))
+        current = None
+
+    if current is None:
+        print(f"🛠️  Migrating: adding product.{COLUMN} {spec} and backfilling it from product.embedding")
+        conn.execute(text(f"ALTER TABLE product ADD COLUMN {COLUMN} {spec}"))
+        # A JSON array's text form is also a valid vector literal
+        conn.execute(text(
+            f"UPDATE product SET {COLUMN} = CAST(CAST(embedding AS TEXT) AS {spec}) "
+            f"WHERE CASE WHEN json_typeof(embedding) = 'array' THEN json_array_length(embedding) = {dim} ELSE false END"
+        ))
+        # Every writer (ORM, bulk scripts, full_migration) stores JSON; the trigger mirrors it
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {TRIGGER_FUNCTION}() RETURNS trigger AS $$ BEGIN "
+            f"NEW.{COLUMN} = CASE "
+            f"WHEN NEW.embedding IS NULL OR json_typeof(NEW.embedding) <> 'array' THEN NULL "
+            f"WHEN json_array_length(NEW.embedding) <> {dim} THEN NULL "
+            f"ELSE CAST(CAST(NEW.embedding AS TEXT) AS {spec}) END; "
+            f"RETURN NEW; END $$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {TRIGGER_FUNCTION} ON product"))
+        conn.execute(text(
+            f"CREATE TRIGGER {TRIGGER_FUNCTION} BEFORE INSERT OR UPDATE OF embedding ON product "
+            f"FOR EACH ROW EXECUTE FUNCTION {TRIGGER_FUNCTION}()"
+        ))
+
+    indexes = set(conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'product'")).scalars())
+    wanted = _index_name(PGVECTOR_INDEX)
+    for method in ("hnsw", "ivfflat"):
+        if method != PGVECTOR_INDEX and _index_name(method) in indexes:
+            conn.execute(text(f"DROP INDEX {_index_name(method)}"))
+    if wanted not in indexes:
+        ops = f"{vtype.kind}_cosine_ops"
+        if PGVECTOR_INDEX == "ivfflat":
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM product WHERE {COLUMN} IS NOT NULL")).scalar() or 0
+            lists = IVF_LISTS or max(1, rows // 1000)
+            if not rows:
+                print(f"⚠️  Building IVFFlat index on an empty column; REINDEX {wanted} once embeddings exist")
+            options = f"lists = {lists}"
+        else:
+            options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        print(f"🛠️  Migrating: building {PGVECTOR_INDEX} index {wanted} ({options})")
+        conn.execute(text(f"CREATE INDEX {wanted} ON product USING {PGVECTOR_INDEX} ({COLUMN} {ops}) WITH ({options})"))
+
+
+async def count_vectors(session: AsyncSession, model_id: str) -> int:
+    stmt = text(f"SELECT COUNT(*) FROM product WHERE {COLUMN} IS NOT NULL AND embedding_model = :model")
+    return (await session.execute(stmt, {"model": model_id})).scalar() or 0
+
+
+async def search_similar(session: AsyncSession, model_id: str, query_embedding: Optional[Sequence[float]] = None,
+                         source_id: Optional[int] = None, k: int = 24, conditions: Sequence = ()) -> List[Tuple[int, float]]:
+    """
+    Top-k cosine search executed by Postgres over the ANN index. The query is
+    either an embedding (full dimension, as stored) or the stored vector of
+    product source_id, which is then excluded from the results. `conditions`
+    are extra SQLAlchemy filters on Product, applied during the index scan.
+    Returns (id, score) pairs scored like MLService.find_similar_products.
+    """
+    vtype = vector_type()
+    vec_col = literal_column(f"product.{COLUMN}", type_=vtype)
+    if source_id is not None:
+        source = table("product", column("id"), column("embedding_model"), column(COLUMN, vtype)).alias("source")
+        query_vec = select(source.c[COLUMN]).where(
+            source.c.id == source_id, source.c.embedding_model == model_id).scalar_subquery()
+    else:
+        query_vec = cast(literal(vector_literal(query_embedding), Text), vtype)
+    distance = vec_col.op("<=>", return_type=Float)(query_vec).label("distance")
+
+    stmt = select(Product.id, distance).where(Product.embedding_model == model_id, vec_col != None, *conditions)
+    if source_id is not None:
+        # Evaluated once (InitPlan): an unknown or unembedded source product yields no rows
+        stmt = stmt.where(Product.id != source_id, query_vec != None)
+    stmt = stmt.order_by(distance).limit(k)
+
+    # SET LOCAL only lasts for this transaction, so it is safe behind the transaction pooler
+    if PGVECTOR_INDEX == "ivfflat":
+        await session.execute(text(f"SET LOCAL ivfflat.probes = {IVF_PROBES}"))
+        if ITERATIVE_SCAN:
+            await session.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+    else:
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, k)}"))
+        if ITERATIVE_SCAN:
+            await session.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+    rows = (await session.execute(stmt)).all()
+
+    # relaxed_order may return rows slightly out of order
+    rows.sort(key=lambda r: r[1])
+    return [(pid, round(max(0.0, (1.0 - dist) * 100), 1)) for pid, dist in rows]
@@ -0,0 +1,196 @@
+import os
+import numpy as np
+from typing import Optional
+
+# Cache Storage Configuration - Configurable via .env
+# ML_CACHE_DTYPE: "float32", "float16", "int8" (per-vector scale) or "pq" (product quantization)
+CACHE_DTYPE = os.getenv("ML_CACHE_DTYPE", "float32")
+# PQ sub-quantizers; the embedding dimension must be divisible by this. 64 -> 64 bytes/vector
+PQ_M = int(os.getenv("ML_PQ_M", "64"))
+# Fewest vectors PQ codebooks are trained on (at least one per centroid); smaller indexes are stored as int8
+PQ_MIN_TRAIN = max(256, int(os.getenv("ML_PQ_MIN_TRAIN", "256")))
+# Re-score this many top candidates with the full-precision vectors (0 = off)
+RERANK = int(os.getenv("ML_RERANK", "0"))
+
+# Rows decoded per block when scoring compressed codes, keeps temporaries small
+SCORE_BLOCK = 4096
+
+
+class Codec:
+    """
+    Compresses L2-normalized float32 vectors into compact codes and scores a
+    float32 query against those codes directly (asymmetric distance computation).
+    """
+    name = "base"
+    # Fewest vectors fit() accepts
+    min_train = 0
+
+    def __init__(self):
+        self.dim = 0
+
+    def fit(self, x: np.ndarray):
+        self.dim = x.shape[1] if x.ndim == 2 else 0
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Inner products between the query and every encoded row."""
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK):
+            out[start:start + SCORE_BLOCK] = self.decode(codes[start:start + SCORE_BLOCK]) @ query
+        return out
+
+
+class Float32Codec(Codec):
+    """Identity codec: codes are the vectors themselves."""
+    name = "float32"
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(x, dtype=np.float32)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return codes @ query
+
+
+class Float16Codec(Codec):
+    """Half precision storage, 2x smaller than float32."""
+    name = "float16"
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(x, dtype=np.float16)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+
+class Int8Codec(Codec):
+    """
+    Symmetric scalar quantization with one float32 scale per vector.
+    Codes are a structured array so the scale travels with its row.
+    """
+    name = "int8"
+
+    def _dtype(self):
+        return np.dtype([("q", np.int8, (self.dim,)), ("scale", np.float32)])
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        scale = np.abs(x).max(axis=1) / 127.0 if len(x) else np.empty(0, dtype=np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        codes = np.empty(len(x), dtype=self._dtype())
+        codes["q"] = np.clip(np.rint(x / scale[:, None]), -127, 127)
+        codes["scale"] = scale
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes["q"].astype(np.float32) * codes["scale"][:, None]
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK):
+            block = codes[start:start + SCORE_BLOCK]
+            out[start:start + SCORE_BLOCK] = (block["q"].astype(np.float32) @ query) * block["scale"]
+        return out
+
+
+def kmeans(x: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd k-means (squared Euclidean) used to train PQ codebooks."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(x))
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = nearest_centroid(x, centroids)
+        counts = np.bincount(assign, minlength=n_clusters)
+        sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=n_clusters)
+                         for d in range(x.shape[1])], axis=1)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def nearest_centroid(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c)
+    dists = (centroids ** 2).sum(axis=1)[None, :] - 2 * (x @ centroids.T)
+    return dists.argmin(axis=1)
+
+
+class PQCodec(Codec):
+    """
+    Product quantization: the vector is split into `m` sub-vectors, each
+    replaced by the id of its nearest centroid in a 256-entry codebook, so a
+    vector costs `m` bytes. Queries build an (m, 256) lookup table once and
+    score every code with table gathers.
+    """
+    name = "pq"
+
+    def __init__(self, m: int = PQ_M, train_size: int = 20_000, min_train: int = PQ_MIN_TRAIN):
+        super().__init__()
+        self.m = m
+        self.ksub = 256
+        self.train_size = train_size
+        self.min_train = min_train
+        self.codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+
+    @property
+    def dsub(self) -> int:
+        return self.dim // self.m
+
+    def fit(self, x: np.ndarray):
+        super().fit(x)
+        if self.dim % self.m != 0:
+            raise ValueError(f"Embedding dimension {self.dim} is not divisible by ML_PQ_M={self.m}")
+        if len(x) < self.min_train:
+            raise ValueError(f"PQ needs at least {self.min_train} training vectors, got {len(x)}")
+        rng = np.random.default_rng(0)
+        train = x[rng.choice(len(x), self.train_size, replace=False)] if len(x) > self.train_size else x
+        train = np.asarray(train, dtype=np.float32)
+
+        codebooks = np.zeros((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = train[:, j * self.dsub:(j + 1) * self.dsub]
+            codebooks[j] = kmeans(sub, self.ksub)
+        self.codebooks = codebooks
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = x[:, j * self.dsub:(j + 1) * self.dsub]
+            codes[:, j] = nearest_centroid(sub, self.codebooks[j]) if len(x) else 0
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.m)]
+        return np.concatenate(parts, axis=1) if parts else np.empty((0, self.dim), dtype=np.float32)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # (m, ksub) table of sub-vector inner products, then one gather per sub-quantizer
+        lut = np.einsum('jkd,jd->jk', self.codebooks, query.reshape(self.m, self.dsub))
+        out = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.m):
+            out += lut[j][codes[:, j]]
+        return out
+
+
+CODECS = {
+    "float32": Float32Codec,
+    "float16": Float16Codec,
+    "int8": Int8Codec,
+    "pq": PQCodec,
+}
+
+
+def create_codec(name: str = CACHE_DTYPE) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown ML_CACHE_DTYPE '{name}'. Choose from: {', '.join(CODECS)}")
+    return CODECS[name]()
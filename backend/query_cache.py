@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# Query Cache Configuration - Configurable via .env
+# Uploaded images remembered (0 disables the cache)
+QUERY_CACHE_SIZE = int(os.getenv("ML_QUERY_CACHE_SIZE", "1024"))
+# Seconds a cached query stays valid
+QUERY_CACHE_TTL = float(os.getenv("ML_QUERY_CACHE_TTL", "3600"))
+# Also match re-encoded / resized copies of an upload by perceptual hash
+QUERY_CACHE_PHASH = os.getenv("ML_QUERY_CACHE_PHASH", "off").lower() == "on"
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Stores value for `ttl` seconds, or the cache-wide ttl when None."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def perceptual_hash(img: Image.Image) -> int:
+    """
+    64-bit difference hash: the image is shrunk to 9x8 grayscale and each bit
+    records whether a pixel is brighter than its right neighbour. Survives
+    re-encoding, resizing and small colour shifts.
+    """
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class CachedQuery:
+    """Embedding of an uploaded image plus the results it produced against one index version."""
+    __slots__ = ("embedding", "results", "index_version")
+
+    def __init__(self, embedding: np.ndarray, results: Optional[List[Tuple[int, float]]], index_version: int):
+        self.embedding = embedding
+        self.results = results
+        self.index_version = index_version
+
+
+class QueryCache:
+    """
+    Remembers image-search queries by the SHA-256 of the uploaded bytes and,
+    optionally, by perceptual hash. A hit skips decoding (exact match) and
+    inference; cached results are only reused while the similarity index is
+    unchanged, otherwise the cached embedding is searched again.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 perceptual: bool = QUERY_CACHE_PHASH):
+        self.perceptual = perceptual
+        self._by_digest = LRUCache(max_size, ttl)
+        self._by_phash = LRUCache(max_size, ttl)
+        # Monitoring counters; misses are queries that were not held in memory
+        # (persistent_hits were then found in the on-disk image embedding cache)
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def lookup(self, digest: str) -> Optional[CachedQuery]:
+        entry = self._by_digest.get(digest)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def lookup_perceptual(self, phash: Optional[int]) -> Optional[CachedQuery]:
+        if phash is None:
+            return None
+        entry = self._by_phash.get(phash)
+        if entry is not None:
+            self.perceptual_hits += 1
+        return entry
+
+    def store(self, digest: str, phash: Optional[int], entry: CachedQuery):
+        """Records a freshly computed query under its digest (and perceptual hash)."""
+        self.misses += 1
+        self._by_digest.set(digest, entry)
+        if phash is not None:
+            self._by_phash.set(phash, entry)
+
+    def store_persistent_hit(self, digest: str, entry: CachedQuery):
+        """Records a query whose embedding came from the persistent image embedding cache."""
+        self.persistent_hits += 1
+        self._by_digest.set(digest, entry)
+
+    def alias(self, digest: str, entry: CachedQuery):
+        """Maps another upload's digest to an entry found by perceptual hash."""
+        self._by_digest.set(digest, entry)
+
+    def clear(self):
+        self._by_digest.clear()
+        self._by_phash.clear()
+
+    def stats(self) -> dict:
+        found = self.hits + self.perceptual_hits + self.persistent_hits
+        lookups = found + self.misses
+        return {
+            "entries": len(self._by_digest),
+            "hits": self.hits,
+            "perceptual_hits": self.perceptual_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(found / lookups, 3) if lookups else 0.0,
+        }
+
+
+query_cache = QueryCache()
@@ -0,0 +1,187 @@
+import os
+import time
+import argparse
+import contextlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from dim_reduction import ARTIFACTS_DIR, PCAProjection
+from vector_index import normalize_rows
+import embedding_store
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # BLAS threads are left alone; blocks still run in parallel
+    threadpool_limits = None
+
+# Recommendation Table Configuration - Configurable via .env
+RECS_PATH = os.getenv("ML_RECS_PATH", os.path.join(ARTIFACTS_DIR, "recommendations.npz"))
+# Neighbours stored per product; requests for more fall back to a live index search
+RECS_K = int(os.getenv("ML_RECS_K", "20"))
+# Query rows per matrix multiply; each worker holds a (block, N) float32 score matrix
+RECS_BLOCK = int(os.getenv("ML_RECS_BLOCK", "256"))
+RECS_WORKERS = int(os.getenv("ML_RECS_WORKERS", str(os.cpu_count() or 1)))
+# Set to "off" to always compute recommendations from the live index
+RECS_ENABLED = os.getenv("ML_RECS", "on").lower() != "off"
+
+
+def compute_neighbours(ids: np.ndarray, matrix: np.ndarray, k: int = RECS_K, block_size: int = RECS_BLOCK,
+                       workers: int = RECS_WORKERS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k cosine neighbours (excluding the product itself) for every row
+    of an (N, D) matrix. Row blocks are scored with one matrix multiply each
+    and spread over `workers` threads, with BLAS pinned to one thread per
+    worker so the cores are not oversubscribed.
+    Returns (neighbour product ids, similarities), both (N, k) and sorted.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    matrix = np.ascontiguousarray(normalize_rows(np.asarray(matrix, dtype=np.float32)))
+    n = len(ids)
+    k = max(0, min(k, n - 1))
+    neighbours = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    def run_block(start: int):
+        stop = min(start + block_size, n)
+        sims = matrix[start:stop] @ matrix.T
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < n else np.argsort(-sims, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbours[start:stop] = ids[np.take_along_axis(top, order, axis=1)]
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    limits = threadpool_limits(limits=1, user_api="blas") if threadpool_limits and workers > 1 else contextlib.nullcontext()
+    with limits, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(run_block, range(0, n, block_size)))
+    return neighbours, scores
+
+
+class RecommendationTable:
+    """
+    Precomputed "similar products" lists. Product ids index a dense position
+    array, so a lookup is a single array access followed by a row slice.
+    model_id, source_rows and source_id_sum identify the embedding store the
+    table was computed from, as in the store's manifest.
+    """
+
+    def __init__(self, ids: np.ndarray, neighbours: np.ndarray, scores: np.ndarray, mtime: float = 0.0,
+                 model_id: str = "", source_rows: int = -1, source_id_sum: int = -1):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.neighbours = neighbours
+        self.scores = scores
+        self.mtime = mtime
+        self.model_id = model_id
+        self.source_rows = source_rows
+        self.source_id_sum = source_id_sum
+        self.position = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int32)
+        self.position[self.ids] = np.arange(len(self.ids), dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def k(self) -> int:
+        return self.neighbours.shape[1]
+
+    def matches(self, model_id: str, source_rows: Optional[int], source_id_sum: Optional[int]) -> bool:
+        """True if the table was computed from these embeddings."""
+        return (self.model_id, self.source_rows, self.source_id_sum) == (model_id, source_rows, source_id_sum)
+
+    def lookup(self, product_id: int, limit: int) -> Optional[List[int]]:
+        """Neighbour ids for product_id, or None if it is not (or no longer) covered."""
+        if limit > self.k or not 0 <= product_id < len(self.position):
+            return None
+        row = self.position[product_id]
+        if row < 0:
+            return None
+        return self.neighbours[row, :limit].tolist()
+
+    def invalidate(self, product_ids: np.ndarray):
+        """
+        Stops serving rows whose embedding changed (or was removed) since the
+        table was built, and every row listing one of them as a neighbour.
+        Those products fall back to a live index search until the next rebuild.
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if len(product_ids) == 0:
+            return
+        listing = np.isin(self.neighbours, product_ids).any(axis=1)
+        self.position[self.ids[listing]] = -1
+        product_ids = product_ids[(product_ids >= 0) & (product_ids < len(self.position))]
+        self.position[product_ids] = -1
+
+    def save(self, path: str = RECS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=self.ids, neighbours=self.neighbours, scores=self.scores.astype(np.float16),
+                     model=np.array(self.model_id), source_rows=np.int64(self.source_rows),
+                     source_id_sum=np.int64(self.source_id_sum))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = RECS_PATH, model_id: Optional[str] = None,
+             store_dir: str = embedding_store.STORE_DIR) -> Optional["RecommendationTable"]:
+        """
+        Returns None unless the table was computed from the current embedding
+        store (and, when given, by the model_id being served); a table from an
+        older export may list products that were since removed or re-embedded.
+        """
+        if not RECS_ENABLED or not os.path.exists(path):
+            return None
+        try:
+            mtime = os.path.getmtime(path)
+            data = np.load(path)
+            table = cls(data["ids"], data["neighbours"], data["scores"], mtime, model_id=str(data["model"]),
+                        source_rows=int(data["source_rows"]), source_id_sum=int(data["source_id_sum"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Could not load recommendation table {path}: {e}")
+            return None
+        manifest = embedding_store.read_manifest(store_dir)
+        if manifest is None or not table.matches(manifest["model"], manifest["source_rows"], manifest.get("source_id_sum")):
+            print(f"⚠️  Recommendation table {path} was not built from the current embedding store. "
+                  f"Run generate_embeddings.py to rebuild it.")
+            return None
+        if model_id is not None and table.model_id != model_id:
+            print(f"⚠️  Recommendation table {path} holds {table.model_id} neighbours, serving {model_id}. Ignoring it.")
+            return None
+        print(f"🤝 Loaded recommendation table: {len(table)} products x {table.k} neighbours")
+        return table
+
+
+def build_table(ids: np.ndarray, vectors: np.ndarray, manifest: dict, k: int = RECS_K, path: str = RECS_PATH,
+                workers: int = RECS_WORKERS) -> RecommendationTable:
+    """
+    Computes and saves the table in the space the API searches in, i.e. after
+    the PCA projection when one is fitted. manifest is that of the embedding
+    store holding these vectors.
+    """
+    projection = PCAProjection.load()
+    if projection is not None and vectors.shape[1] == projection.input_dim:
+        vectors = projection.transform(vectors)
+    start = time.perf_counter()
+    neighbours, scores = compute_neighbours(ids, vectors, k=k, workers=workers)
+    table = RecommendationTable(ids, neighbours, scores, model_id=manifest["model"],
+                                source_rows=manifest["source_rows"], source_id_sum=manifest.get("source_id_sum"))
+    table.save(path)
+    print(f"🤝 Recommendation table: {len(ids)} products x {table.k} neighbours in "
+          f"{time.perf_counter() - start:.1f}s ({workers} workers). Saved to {path}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute product recommendations from the embedding store.")
+    parser.add_argument("--k", type=int, default=RECS_K, help="Neighbours stored per product")
+    parser.add_argument("--workers", type=int, default=RECS_WORKERS)
+    parser.add_argument("--output", default=RECS_PATH)
+    args = parser.parse_args()
+
+    loaded = embedding_store.load_store()
+    if loaded is None:
+        print("No embedding store found. Run generate_embeddings.py first.")
+    else:
+        store_ids, store_vectors, store_manifest = loaded
+        build_table(store_ids, np.asarray(store_vectors), store_manifest, k=args.k, path=args.output, workers=args.workers)
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from sqlmodel import select, or_, cast, String
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_session, init_db
+from models import Product
+from ml_service import ml_service
+from image_embedding_cache import image_embedding_cache, content_digest
+
+# Windows selector event loop policy fix
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# Refresh Configuration - Configurable via .env / command line
+# Products read (and written back) per keyset batch
+DB_BATCH_SIZE = 256
+# Concurrent image downloads
+FETCH_CONCURRENCY = 32
+# Images per forward pass
+INFERENCE_BATCH_SIZE = 64
+FETCH_TIMEOUT = 30
+# Images referenced as /dataset/images/... are read from here when present, else fetched from BASE_URL
+DATASET_IMAGES_PATH = os.path.join(os.getenv("DATASET_PATH", ""), "images")
+BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+
+
+async def next_batch(session: AsyncSession, last_id: int, refresh_all: bool, batch_size: int) -> List[Tuple[int, list]]:
+    """Only (id, image_urls), in primary-key order; never the stored embeddings."""
+    stmt = select(Product.id, Product.image_urls).where(Product.id > last_id)
+    if not refresh_all:
+        # Never embedded ('[]' is the seed placeholder), or embedded by another backbone than ML_BACKBONE
+        stmt = stmt.where(or_(Product.embedding == None, cast(Product.embedding, String).in_(["", "[]", "null"]),
+                              Product.embedding_model == None, Product.embedding_model != ml_service.model_id))
+    rows = (await session.execute(stmt.order_by(Product.id).limit(batch_size))).all()
+    return [(pid, urls) for pid, urls in rows]
+
+
+async def fetch_image(client: httpx.AsyncClient, url: str, semaphore: asyncio.Semaphore) -> Optional[bytes]:
+    if url.startswith("/dataset/images/"):
+        local_path = os.path.join(DATASET_IMAGES_PATH, url.rsplit('/', 1)[-1])
+        if os.path.exists(local_path):
+            return await asyncio.to_thread(_read_file, local_path)
+    if not url.startswith("http"):
+        url = f"{BASE_URL.rstrip('/')}/{url.lstrip('/')}"
+    async with semaphore:
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            print(f"Failed to fetch {url}: {e}")
+            return None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def fetch_batch(client: httpx.AsyncClient, batch: List[Tuple[int, list]], semaphore: asyncio.Semaphore) -> List[Tuple[int, Optional[bytes]]]:
+    """Downloads each product's first image concurrently; URLs shared by several products are fetched once."""
+    urls = {pid: image_urls[0] for pid, image_urls in batch if image_urls}
+    unique = list(dict.fromkeys(urls.values()))
+    contents = await asyncio.gather(*(fetch_image(client, url, semaphore) for url in unique))
+    by_url = dict(zip(unique, contents))
+    return [(pid, by_url[url]) for pid, url in urls.items()]
+
+
+def embed_batch(fetched: List[Tuple[int, Optional[bytes]]], inference_batch_size: int, stats: dict) -> List[Tuple[int, np.ndarray]]:
+    """
+    Runs in a worker thread. Looks every image up in the content-addressed
+    cache, decodes the rest and embeds them in batches (each distinct image once).
+    """
+    vectors: Dict[str, np.ndarray] = {}
+    to_embed: Dict[str, object] = {}
+    digests = []
+    for pid, data in fetched:
+        if data is None:
+            stats["failed"] += 1
+            continue
+        digest = content_digest(data)
+        if digest not in vectors and digest not in to_embed:
+            cached = image_embedding_cache.get(digest, ml_service.model_id)
+            if cached is not None:
+                vectors[digest] = cached
+                stats["reused"] += 1
+            else:
+                try:
+                    to_embed[digest] = ml_service.load_image(data)
+                except Exception as e:
+                    print(f"Could not decode image for product {pid}: {e}")
+                    stats["failed"] += 1
+                    continue
+        digests.append((pid, digest))
+
+    pending = list(to_embed.items())
+    failed = set()
+    for start in range(0, len(pending), inference_batch_size):
+        chunk = pending[start:start + inference_batch_size]
+        try:
+            embeddings = ml_service.extract_features_batch([img for _, img in chunk], project=False)
+            new_images = [(digest, emb) for (digest, _), emb in zip(chunk, embeddings)]
+            vectors.update(new_images)
+            image_embedding_cache.put_many(new_images, ml_service.model_id)
+            stats["inferred"] += len(chunk)
+        except Exception as e:
+            print(f"Inference failed for a batch of {len(chunk)} images: {e}")
+            failed.update(digest for digest, _ in chunk)
+        finally:
+            for _, img in chunk:
+                img.close()
+    stats["failed"] += sum(1 for _, digest in digests if digest in failed)
+
+    return [(pid, vectors[digest]) for pid, digest in digests if digest in vectors]
+
+
+async def bulk_update(session: AsyncSession, rows: List[Tuple[int, np.ndarray]]):
+    """
+    Writes a whole batch with one UPDATE ... FROM (VALUES ...) statement.
+    The VALUES list is wrapped in a CTE so the same SQL runs on SQLite
+    (3.33+) and Postgres; Postgres additionally needs explicit casts.
+    """
+    if not rows:
+        return
+    postgres = session.bind.dialect.name == "postgresql"
+    embedding_param = "CAST(:e{i} AS JSON)" if postgres else ":e{i}"
+    values, params = [], {"model": ml_service.model_id, "now": datetime.utcnow()}
+    for i, (pid, vector) in enumerate(rows):
+        values.append(f"(CAST(:id{i} AS INTEGER), {embedding_param.format(i=i)})")
+        params[f"id{i}"] = pid
+        params[f"e{i}"] = json.dumps(vector.tolist())
+    stmt = text(
+        f"WITH v(id, embedding) AS (VALUES {', '.join(values)}) "
+        "UPDATE product SET embedding = v.embedding, embedding_model = :model, updated_at = :now "
+        "FROM v WHERE product.id = v.id"
+    )
+    await session.execute(stmt, params)
+    await session.commit()
+
+
+async def refresh_embeddings(refresh_all: bool = False, batch_size: int = DB_BATCH_SIZE,
+                             concurrency: int = FETCH_CONCURRENCY, inference_batch_size: int = INFERENCE_BATCH_SIZE):
+    """
+    Streams products in keyset batches, downloading the next batch's images
+    while the current one is embedded, and writes each batch back in bulk.
+    Works against whichever engine database.py is configured for.
+    """
+    print(f"Starting embedding refresh ({'all products' if refresh_all else 'missing or outdated embeddings'}, "
+          f"model {ml_service.model_id})...")
+    await init_db()
+    stats = {"updated": 0, "inferred": 0, "reused": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    start = time.perf_counter()
+
+    async with httpx.AsyncClient(limits=limits, timeout=FETCH_TIMEOUT, follow_redirects=True) as client:
+        async for session in get_session():
+            batch = await next_batch(session, 0, refresh_all, batch_size)
+            fetching = asyncio.create_task(fetch_batch(client, batch, semaphore)) if batch else None
+            while batch:
+                last_id = batch[-1][0]
+                fetched = await fetching
+                # Start downloading the next batch before running inference on this one
+                batch = await next_batch(session, last_id, refresh_all, batch_size)
+                fetching = asyncio.create_task(fetch_batch(client, batch, semaphore)) if batch else None
+
+                rows = await asyncio.to_thread(embed_batch, fetched, inference_batch_size, stats)
+                await bulk_update(session, rows)
+                stats["updated"] += len(rows)
+                elapsed = time.perf_counter() - start
+                print(f"➡️ Updated {stats['updated']} products (up to id {last_id}, "
+                      f"{stats['updated'] / max(elapsed, 1e-6):.1f} images/sec, {stats['inferred']} inferred, "
+                      f"{stats['reused']} reused, {stats['failed']} failed)")
+            break
+
+    elapsed = time.perf_counter() - start
+    print(f"Finished. Updated {stats['updated']} products in {elapsed:.1f}s "
+          f"({stats['inferred']} images inferred, {stats['reused']} reused from cache). Errors: {stats['failed']}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed product images against the configured database.")
+    parser.add_argument("--all", action="store_true", help="Refresh every product, not only missing or outdated embeddings")
+    parser.add_argument("--batch-size", type=int, default=DB_BATCH_SIZE, help="Products per keyset batch")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="Concurrent image downloads")
+    parser.add_argument("--inference-batch-size", type=int, default=INFERENCE_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(refresh_embeddings(args.all, args.batch_size, args.concurrency, args.inference_batch_size))
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import importlib
+from typing import Any, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from query_cache import LRUCache
+
+# Response Cache Configuration - Configurable via .env
+# Responses kept per worker (0 disables server-side caching; ETags are still sent)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Seconds a cached response is served before the database is queried again
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+# Seconds browsers may reuse a response without revalidating (Cache-Control max-age)
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "30"))
+# "memory" (default, per worker) or "package.module:factory" returning a CacheBackend,
+# e.g. one backed by Redis so that all workers share entries and invalidations
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+
+
+class CacheBackend:
+    """
+    Storage for rendered response bodies. Implement this to share the cache
+    between workers; values are plain bytes so any key-value store fits.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU with per-entry expiry; every worker keeps its own copy."""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self._cache = LRUCache(max_size, RESPONSE_CACHE_TTL)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._cache.set(key, value, ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+
+def _load_backend(spec: str) -> CacheBackend:
+    if spec == "memory":
+        return MemoryBackend()
+    module_name, _, attr = spec.partition(":")
+    try:
+        return getattr(importlib.import_module(module_name), attr)()
+    except Exception as e:
+        print(f"⚠️  Could not load response cache backend {spec!r} ({e}); using the in-memory cache")
+        return MemoryBackend()
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    Caches the JSON bodies of read-only catalog endpoints, keyed by path and
+    query string. Hits never touch the database. Every response carries an
+    ETag and Cache-Control, and a matching If-None-Match gets an empty 304.
+    Entries expire after RESPONSE_CACHE_TTL seconds or on invalidate(),
+    which the delta poll calls when the catalog changes.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = RESPONSE_CACHE_TTL, max_age: int = RESPONSE_CACHE_MAX_AGE):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_age = max_age
+        # (product count, latest updated_at) seen by the last check; see cache_warmup.refresh_response_cache
+        self.catalog_version: Optional[tuple] = None
+
+    @staticmethod
+    def key(request: Request) -> str:
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"response:{request.url.path}?{params}"
+
+    def _respond(self, request: Request, body: bytes, hit: bool) -> Response:
+        etag = etag_for(body)
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}",
+                   "X-Cache": "HIT" if hit else "MISS"}
+        if _matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def get(self, request: Request) -> Optional[Response]:
+        """The cached response for this request (or a 304), None on a miss."""
+        body = self.backend.get(self.key(request))
+        if body is None:
+            return None
+        return self._respond(request, body, hit=True)
+
+    def put(self, request: Request, content: Any) -> Response:
+        """Renders `content` (anything jsonable_encoder accepts), stores and returns it."""
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.backend.set(self.key(request), body, self.ttl)
+        return self._respond(request, body, hit=False)
+
+    def invalidate(self):
+        self.backend.clear()
+
+
+response_cache = ResponseCache(_load_backend(RESPONSE_CACHE_BACKEND))
@@ -41,7 +41,8 @@ def seed_database():
         category_map[cat_name] = cursor.fetchone()[0]
 
     count = 0
-    df = df.where(pd.notnull(df), None) # Convert NaN to None for easier handling
+    # Convert NaN to None for easier handling (object dtype, or float columns like year turn None back into NaN)
+    df = df.astype(object).where(pd.notnull(df), None)
 
     for _, row in df.iterrows():
         product_id = row['id']
@@ -84,8 +85,8 @@ def seed_database():
         image_urls = json.dumps([f"/dataset/images/{image_name}"])
         
         cursor.execute("""
-            INSERT INTO product (name, description, price, rating, stock, category_id, image_urls, attributes, is_featured, is_popular, is_new, created_at, embedding)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)
+            INSERT INTO product (name, description, price, rating, stock, category_id, image_urls, attributes, is_featured, is_popular, is_new, created_at, updated_at, embedding)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), ?)
         """, (name, description, price, 4.5, 100, category_id, image_urls, json.dumps(attributes), 0, 0, 1, json.dumps([])))
 
         count += 1
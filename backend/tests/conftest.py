@@ -0,0 +1,77 @@
+import os
+import sys
+import asyncio
+import sqlite3
+import tempfile
+import pytest
+
+# Tests import the backend's flat modules the way main.py does
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("USE_CLOUD_DB", "local")
+# Embedding store, PCA and caches are written here instead of backend/ml_artifacts
+os.environ.setdefault("ML_ARTIFACTS_DIR", tempfile.mkdtemp(prefix="fashion-fiesta-tests-"))
+
+import database  # noqa: E402
+import models  # noqa: E402,F401  (registers the tables for init_db)
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    A fresh, migrated local database (./fashion_fiesta.db inside tmp_path).
+    Yields a sqlite3 connection for arranging rows the way the seed scripts do.
+    """
+    monkeypatch.chdir(tmp_path)
+    # SQLAlchemy resolves the relative sqlite path when the engine is created.
+    # NullPool: TestClient and asyncio.run use different event loops, and
+    # aiosqlite connections must not outlive the loop that opened them.
+    monkeypatch.setattr(database, "engine", create_async_engine(database.LOCAL_URL, poolclass=NullPool))
+    asyncio.run(database.init_db())
+    conn = sqlite3.connect(tmp_path / "fashion_fiesta.db")
+    conn.execute("INSERT INTO category (id, name, image_url) VALUES (1, 'Apparel', '')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def insert_product(conn: sqlite3.Connection, name: str = "Shirt", created_at: str = "datetime('now')",
+                   embedding: str = "[]", embedding_model=None, **attributes) -> int:
+    """Inserts a product like seed_fashion_dataset does; created_at is an SQL expression."""
+    import json
+    cursor = conn.execute(
+        f"INSERT INTO product (name, description, price, rating, stock, category_id, image_urls, attributes, "
+        f"is_featured, is_popular, is_new, created_at, updated_at, embedding, embedding_model) "
+        f"VALUES (?, 'Cotton', 10, 4.5, 100, 1, '[]', ?, 0, 0, 1, {created_at}, {created_at}, ?, ?)",
+        (name, json.dumps(attributes), embedding, embedding_model),
+    )
+    conn.commit()
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def fresh_ml(db):
+    """The ml_service singleton with an empty index and no embedding store, as right after startup."""
+    import shutil
+    import embedding_store
+    from attribute_filter import CatalogAttributes
+    from ml_service import ml_service
+    from vector_index import ExactIndex
+    shutil.rmtree(embedding_store.STORE_DIR, ignore_errors=True)
+    ml_service.index = ExactIndex()
+    ml_service.attributes = CatalogAttributes()
+    ml_service.recommendations = None
+    ml_service.recommendations_mtime = 0.0
+    ml_service.high_water = None
+    ml_service.source_rows = 0
+    ml_service.source_id_sum = 0
+    ml_service.cache_ready = False
+    yield ml_service
+    shutil.rmtree(embedding_store.STORE_DIR, ignore_errors=True)
+
+
+def random_embedding(rng, dim: int = 16) -> str:
+    import json
+    return json.dumps(rng.standard_normal(dim).round(6).tolist())
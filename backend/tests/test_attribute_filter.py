@@ -0,0 +1,25 @@
+import numpy as np
+from attribute_filter import CatalogAttributes
+
+
+def test_arrays_grow_geometrically_and_only_past_capacity():
+    attributes = CatalogAttributes()
+    reallocations, array = 0, attributes.category
+    for pid in range(1, 1001):
+        attributes.update([(pid, 1, 10.0, "Men", "Shirts")])
+        if attributes.category is not array:
+            reallocations, array = reallocations + 1, attributes.category
+    assert reallocations <= 11
+    attributes.update([(5, 2, 20.0, "Women", "Tops")])
+    assert attributes.category is array
+
+
+def test_in_place_updates_rebuild_the_aligned_masks():
+    attributes = CatalogAttributes()
+    attributes.update([(1, 1, 10.0, "Men", "Shirts"), (2, 1, 30.0, "Women", "Tops")])
+    ids = np.array([1, 2, 3])
+    assert attributes.mask(ids, {"gender": "men"}).tolist() == [True, False, False]
+
+    attributes.update([(2, 1, 30.0, "Men", "Shirts")])
+    assert attributes.mask(ids, {"gender": "men"}).tolist() == [True, True, False]
+    assert attributes.mask(ids, {"max_price": 20}).tolist() == [True, False, False]
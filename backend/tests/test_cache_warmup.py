@@ -0,0 +1,83 @@
+import asyncio
+import json
+import numpy as np
+import cache_warmup
+from vector_index import ExactIndex
+from conftest import insert_product, random_embedding
+
+
+def warm(ml):
+    assert asyncio.run(cache_warmup.warm_ml_cache())
+    return ml.index
+
+
+def test_warm_up_streams_the_database_then_maps_the_store(db, fresh_ml, capsys):
+    rng = np.random.default_rng(0)
+    ids = [insert_product(db, f"p{i}", embedding=random_embedding(rng), embedding_model=fresh_ml.model_id)
+           for i in range(30)]
+    insert_product(db, "unembedded")
+
+    index = warm(fresh_ml)
+    assert sorted(index.ids.tolist()) == ids and fresh_ml.cache_ready
+    assert "from database" in capsys.readouterr().out
+
+    # A restarted worker maps the store written by the first warm-up
+    fresh_ml.index = ExactIndex()
+    index = warm(fresh_ml)
+    assert sorted(index.ids.tolist()) == ids
+    assert "from embedding store" in capsys.readouterr().out
+
+    pid, embedding = db.execute("SELECT id, embedding FROM product WHERE id = ?", (ids[7],)).fetchone()
+    assert fresh_ml.find_similar_products(json.loads(embedding), k=1)[0] == (pid, 100.0)
+
+
+def poll():
+    async def run():
+        async for session in cache_warmup.get_session():
+            return await cache_warmup.poll_deltas(session)
+    return asyncio.run(run())
+
+
+def test_delta_poll_applies_inserts_updates_and_clears(db, fresh_ml):
+    rng = np.random.default_rng(1)
+    ids = [insert_product(db, f"p{i}", created_at="'2024-01-01 00:00:00'", embedding=random_embedding(rng),
+                          embedding_model=fresh_ml.model_id) for i in range(20)]
+    warm(fresh_ml)
+
+    added = insert_product(db, "new", created_at="'2024-02-01 00:00:00'", embedding=random_embedding(rng),
+                           embedding_model=fresh_ml.model_id)
+    moved = random_embedding(rng)
+    db.execute("UPDATE product SET embedding = ?, updated_at = '2024-02-01 00:00:00' WHERE id = ?", (moved, ids[0]))
+    db.execute("UPDATE product SET embedding = '[]', updated_at = '2024-02-01 00:00:00' WHERE id = ?", (ids[1],))
+    db.commit()
+
+    assert poll() == (2, 1)
+    assert len(fresh_ml.index) == 20 and fresh_ml.index.n_tail == 2
+    assert fresh_ml.find_similar_products(json.loads(moved), k=1)[0] == (ids[0], 100.0)
+    assert added in fresh_ml.index.ids and poll() == (0, 0)
+
+
+def test_equal_deletes_and_inserts_are_reconciled(db, fresh_ml, capsys):
+    rng = np.random.default_rng(2)
+    ids = [insert_product(db, f"p{i}", created_at="'2024-01-01 00:00:00'", embedding=random_embedding(rng),
+                          embedding_model=fresh_ml.model_id) for i in range(10)]
+    warm(fresh_ml)
+
+    # Same row count after the poll's deletion check, different products
+    db.execute("DELETE FROM product WHERE id = ?", (ids[2],))
+    added = insert_product(db, "new", created_at="'2024-02-01 00:00:00'", embedding=random_embedding(rng),
+                           embedding_model=fresh_ml.model_id)
+    db.commit()
+    assert poll() == (1, 1)
+    assert ids[2] not in fresh_ml.index.ids[fresh_ml.index.alive] and len(fresh_ml.index) == 10
+
+    # A restarted worker must not map the store exported before the swap
+    db.execute("DELETE FROM product WHERE id = ?", (ids[3],))
+    insert_product(db, "newer", created_at="'2024-03-01 00:00:00'", embedding=random_embedding(rng),
+                   embedding_model=fresh_ml.model_id)
+    db.commit()
+    capsys.readouterr()
+    fresh_ml.index = ExactIndex()
+    index = warm(fresh_ml)
+    assert "from database" in capsys.readouterr().out
+    assert ids[2] not in index.ids and ids[3] not in index.ids and added in index.ids
@@ -0,0 +1,19 @@
+import numpy as np
+import dim_reduction
+from dim_reduction import PCAProjection, fit_and_save
+
+
+def test_pca_is_opt_in(tmp_path, monkeypatch):
+    path = str(tmp_path / "pca.npz")
+    vectors = np.random.default_rng(0).standard_normal((200, 32)).astype(np.float32)
+
+    assert dim_reduction.PCA_DIM == 0 and fit_and_save(vectors, path=path) is None
+    fit_and_save(vectors, n_components=8, path=path)
+    # A projection left on disk is ignored unless ML_PCA_DIM is configured
+    assert PCAProjection.load(path) is None
+
+    monkeypatch.setattr(dim_reduction, "PCA_ENABLED", True)
+    projection = PCAProjection.load(path)
+    reduced = projection.transform(vectors[:5])
+    assert (projection.input_dim, projection.output_dim) == (32, 8)
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-4)
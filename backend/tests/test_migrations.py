@@ -0,0 +1,30 @@
+import asyncio
+import database
+from conftest import insert_product
+
+
+def test_embedding_model_backfill_skips_placeholder_embeddings(db):
+    # Back to the schema before product.embedding_model existed
+    db.execute("DROP INDEX ix_product_embedding_model")
+    db.execute("ALTER TABLE product DROP COLUMN embedding_model")
+    db.commit()
+    db.execute("INSERT INTO product (name, description, price, rating, stock, category_id, image_urls, attributes, "
+               "is_featured, is_popular, is_new, created_at, updated_at, embedding) VALUES "
+               "('a', '', 1, 0, 0, 1, '[]', '{}', 0, 0, 0, datetime('now'), datetime('now'), '[0.5, 0.25]'), "
+               "('b', '', 1, 0, 0, 1, '[]', '{}', 0, 0, 0, datetime('now'), datetime('now'), '[]'), "
+               "('c', '', 1, 0, 0, 1, '[]', '{}', 0, 0, 0, datetime('now'), datetime('now'), NULL)")
+    db.commit()
+
+    asyncio.run(database.init_db())
+
+    tags = dict(db.execute("SELECT name, embedding_model FROM product").fetchall())
+    assert tags == {"a": "resnet50:IMAGENET1K_V1:224", "b": None, "c": None}
+
+
+def test_migrations_are_idempotent(db):
+    insert_product(db, "Shirt", gender="Men", articleType="Tshirts")
+    asyncio.run(database.init_db())
+    asyncio.run(database.init_db())
+
+    assert db.execute("SELECT gender, article_type FROM product").fetchone() == ("men", "tshirts")
+    assert db.execute("SELECT rowid FROM product_fts WHERE product_fts MATCH 'shirt'").fetchall() == [(1,)]
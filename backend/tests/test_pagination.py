@@ -0,0 +1,84 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api import products
+from api.pagination import NEXT_CURSOR_HEADER
+from models import Product
+from conftest import insert_product
+
+app = FastAPI()
+app.include_router(products.router)
+
+
+def walk(client: TestClient, **params) -> list:
+    """Product ids of every page, following X-Next-Cursor until it is absent."""
+    ids, cursor = [], None
+    for _ in range(100):
+        response = client.get("/products/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [p["id"] for p in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            return ids
+    pytest.fail("cursor pagination did not terminate")
+
+
+@pytest.mark.parametrize("sort_by,order", [("created_at", "asc"), ("price", "desc"), ("name", "asc"), ("id", "desc")])
+def test_cursor_matches_offset_order(db, sort_by, order):
+    # Microsecond timestamps, as the ORM writes them
+    for i in range(23):
+        insert_product(db, f"Shirt {i % 4}", created_at=f"'2024-05-0{1 + i % 3} 10:00:00.000000'")
+    client = TestClient(app)
+
+    ids = walk(client, limit=5, sort_by=sort_by, order=order)
+    offset_ids = [p["id"] for p in client.get("/products/", params={"limit": 100, "sort_by": sort_by, "order": order}).json()]
+    assert ids == offset_ids and len(set(ids)) == 23
+
+
+def test_cursor_rejects_other_sort_order(db):
+    for i in range(3):
+        insert_product(db, f"Shirt {i}")
+    client = TestClient(app)
+    cursor = client.get("/products/", params={"limit": 2}).headers[NEXT_CURSOR_HEADER]
+
+    assert client.get("/products/", params={"limit": 2, "cursor": cursor, "sort_by": "price"}).status_code == 400
+    assert client.get("/products/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_cursor_pages_through_rows_sharing_a_second(db):
+    # datetime('now') stores second precision; ORM writes store microseconds
+    for i in range(25):
+        insert_product(db, f"Shirt {i}", created_at="'2024-05-01 10:00:00'")
+    for i in range(5):
+        insert_product(db, f"Dress {i}", created_at="'2024-05-01 10:00:00.500000'")
+    client = TestClient(app)
+
+    ids = walk(client, limit=10)
+    assert len(ids) == 30 and len(set(ids)) == 30
+    offset_ids = [p["id"] for p in client.get("/products/", params={"limit": 100}).json()]
+    assert ids == offset_ids
+
+
+def test_timestamps_are_stored_at_microsecond_precision(db):
+    pid = insert_product(db, created_at="datetime('now')")
+    created_at, updated_at = db.execute("SELECT created_at, updated_at FROM product WHERE id = ?", (pid,)).fetchone()
+    assert len(created_at) == len(updated_at) == 26
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_cursor_pages_past_null_sort_values(db, monkeypatch, order):
+    for i in range(13):
+        insert_product(db, f"Shirt {i}")
+    # A product table whose price column allows NULLs (CREATE TABLE AS drops the constraints)
+    db.executescript("CREATE TABLE product_nullable AS SELECT * FROM product; DROP TABLE product; "
+                     "ALTER TABLE product_nullable RENAME TO product; "
+                     "UPDATE product SET price = id * 3 % 7 WHERE id % 3; UPDATE product SET price = NULL WHERE id % 3 = 0;")
+    monkeypatch.setattr(Product.__table__.c.price, "nullable", True)
+    client = TestClient(app)
+
+    params = {"sort_by": "price", "order": order, "fields": "id,name"}
+    ids = walk(client, limit=3, **params)
+    offset_ids = [p["id"] for p in client.get("/products/", params={"limit": 100, **params}).json()]
+    assert ids == offset_ids and len(set(ids)) == 13
+    # NULL prices come last in both directions
+    assert ids[-4:] == [3, 6, 9, 12] if order == "asc" else ids[-4:] == [12, 9, 6, 3]
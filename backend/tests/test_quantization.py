@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from quantization import CODECS, PQCodec, create_codec
+from vector_index import ExactIndex, normalize_rows
+
+
+def vectors(n: int = 600, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return normalize_rows(np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32))
+
+
+def fitted(name: str, x: np.ndarray):
+    codec = PQCodec(m=8) if name == "pq" else create_codec(name)
+    codec.fit(x)
+    return codec
+
+
+@pytest.mark.parametrize("name, atol", [("float32", 0.0), ("float16", 1e-3), ("int8", 1e-2), ("pq", None)])
+def test_round_trip(name, atol):
+    x = vectors()
+    codec = fitted(name, x)
+    codes = codec.encode(x)
+    decoded = codec.decode(codes)
+    assert decoded.shape == x.shape and decoded.dtype == np.float32
+    if atol is not None:
+        np.testing.assert_allclose(decoded, x, atol=atol)
+    else:
+        # Lossy, but every row must stay closest to its own reconstruction
+        assert (np.argmax(normalize_rows(decoded) @ x.T, axis=1) == np.arange(len(x))).mean() > 0.9
+    # Encoding the reconstruction is a fixed point
+    np.testing.assert_allclose(codec.decode(codec.encode(decoded)), decoded, atol=atol or 1e-6)
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_score_matches_decoded_inner_products(name):
+    x = vectors()
+    codec = fitted(name, x)
+    codes = codec.encode(x)
+    query = vectors(1, seed=1)[0]
+    np.testing.assert_allclose(codec.score(query, codes), codec.decode(codes) @ query, atol=1e-4)
+
+
+def test_int8_codes_keep_their_scale_through_save_and_load(tmp_path):
+    x = vectors()
+    codec = fitted("int8", x)
+    np.save(tmp_path / "codes.npy", codec.encode(x))
+    loaded = np.load(tmp_path / "codes.npy", mmap_mode="r")
+    assert loaded.dtype == codec._dtype()
+    np.testing.assert_allclose(codec.decode(loaded), x, atol=1e-2)
+
+
+def test_empty_and_invalid_inputs():
+    x = vectors()
+    for name in CODECS:
+        codec = fitted(name, x)
+        assert codec.decode(codec.encode(x[:0])).shape == (0, x.shape[1])
+    with pytest.raises(ValueError):
+        PQCodec(m=5).fit(x)
+    with pytest.raises(ValueError):
+        PQCodec(m=8).fit(x[:255])
+    with pytest.raises(ValueError):
+        create_codec("bfloat16")
+
+
+def test_pq_index_too_small_to_train_is_stored_as_int8():
+    # The first delta batch into an empty index builds it from just those rows
+    x = vectors(20)
+    index = ExactIndex(codec=PQCodec(m=8))
+    index.upsert(np.arange(20), x)
+    assert index.codec.name == "int8"
+    ids, scores = index.search(x[3], 1)
+    assert ids[0] == 3 and scores[0] > 0.99
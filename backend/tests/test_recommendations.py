@@ -0,0 +1,79 @@
+import json
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api import products
+from inference_pool import inference_pool
+from recommendation_table import RecommendationTable, compute_neighbours
+from conftest import insert_product, random_embedding
+from test_cache_warmup import poll, warm
+
+app = FastAPI()
+app.include_router(products.router)
+
+
+def build_recommendations(db, ml, k: int = 3) -> RecommendationTable:
+    rows = db.execute("SELECT id, embedding FROM product ORDER BY id").fetchall()
+    ids = np.array([pid for pid, _ in rows])
+    matrix = np.array([json.loads(embedding) for _, embedding in rows], dtype=np.float32)
+    neighbours, scores = compute_neighbours(ids, matrix, k=k, workers=1)
+    ml.recommendations = RecommendationTable(ids, neighbours, scores, model_id=ml.model_id,
+                                             source_rows=ml.source_rows, source_id_sum=ml.source_id_sum)
+    return ml.recommendations
+
+
+def catalog(db, ml, n: int = 12):
+    rng = np.random.default_rng(3)
+    ids = [insert_product(db, f"p{i}", created_at="'2024-01-01 00:00:00'", embedding=random_embedding(rng),
+                          embedding_model=ml.model_id) for i in range(n)]
+    warm(ml)
+    return ids, rng
+
+
+def test_table_lookups_do_not_take_an_inference_slot(db, fresh_ml, monkeypatch):
+    ids, _ = catalog(db, fresh_ml)
+    table = build_recommendations(db, fresh_ml)
+    monkeypatch.setattr(inference_pool, "in_flight", inference_pool.capacity)
+    client = TestClient(app)
+
+    response = client.get(f"/products/{ids[0]}/recommendations", params={"limit": 3})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == table.lookup(ids[0], 3)
+    # Longer lists than the table holds need a live search, which is admitted by the pool
+    response = client.get(f"/products/{ids[0]}/recommendations", params={"limit": 8})
+    assert response.status_code == 429
+    assert inference_pool.in_flight == inference_pool.capacity
+
+
+def test_delta_poll_invalidates_lists_containing_a_changed_product(db, fresh_ml):
+    ids, rng = catalog(db, fresh_ml)
+    table = build_recommendations(db, fresh_ml)
+    changed = ids[4]
+    listing = [pid for pid in ids if changed in table.lookup(pid, 3)]
+    untouched = [pid for pid in ids if pid not in listing and pid != changed]
+    assert listing and untouched
+
+    db.execute("UPDATE product SET embedding = ?, updated_at = '2024-02-01 00:00:00' WHERE id = ?",
+               (random_embedding(rng), changed))
+    db.commit()
+    assert poll() == (1, 0)
+
+    assert fresh_ml.recommend(changed, 3) is None
+    assert all(fresh_ml.recommend(pid, 3) is None for pid in listing)
+    assert all(fresh_ml.recommend(pid, 3) is not None for pid in untouched)
+
+
+def test_saved_table_is_refused_once_the_store_changes(db, fresh_ml, tmp_path):
+    ids, rng = catalog(db, fresh_ml)
+    path = str(tmp_path / "recommendations.npz")
+    build_recommendations(db, fresh_ml).save(path)
+    assert RecommendationTable.load(path, model_id=fresh_ml.model_id) is not None
+    assert RecommendationTable.load(path, model_id="other-model") is None
+
+    # Same number of rows but a different product: the store written by the next warm-up no longer matches
+    db.execute("DELETE FROM product WHERE id = ?", (ids[0],))
+    insert_product(db, "replacement", created_at="'2024-01-01 00:00:00'", embedding=random_embedding(rng),
+                   embedding_model=fresh_ml.model_id)
+    warm(fresh_ml)
+    assert RecommendationTable.load(path, model_id=fresh_ml.model_id) is None
+    assert fresh_ml.recommendations is None
@@ -0,0 +1,62 @@
+import asyncio
+import numpy as np
+import database
+import refresh_embeddings
+from image_embedding_cache import ImageEmbeddingCache
+from ml_service import ml_service
+from refresh_embeddings import embed_batch, next_batch
+from conftest import insert_product
+
+
+def select_ids(refresh_all: bool = False) -> list:
+    async def run():
+        async for session in database.get_session():
+            return [pid for pid, _ in await next_batch(session, 0, refresh_all, 100)]
+    return asyncio.run(run())
+
+
+def test_next_batch_selects_unembedded_and_stale_products(db):
+    current = ml_service.model_id
+    placeholder = insert_product(db, "placeholder", embedding="[]")
+    # Tagged by the pre-fix embedding_model backfill although never embedded
+    mistagged = insert_product(db, "mistagged", embedding="[]", embedding_model=current)
+    null = insert_product(db, "null", embedding=None)
+    stale = insert_product(db, "stale", embedding="[0.5]", embedding_model="other:backbone")
+    untagged = insert_product(db, "untagged", embedding="[0.5]")
+    insert_product(db, "fresh", embedding="[0.5]", embedding_model=current)
+
+    assert select_ids() == [placeholder, mistagged, null, stale, untagged]
+    assert len(select_ids(refresh_all=True)) == 6
+
+
+class FakeImage:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_a_failed_inference_chunk_is_counted_and_the_rest_still_embedded(tmp_path, monkeypatch):
+    images = []
+
+    def load_image(data):
+        images.append(FakeImage(data))
+        return images[-1]
+
+    def extract_features_batch(batch, project=True):
+        if any(img.data == b"bad" for img in batch):
+            raise RuntimeError("CUDA out of memory")
+        return [np.ones(4, dtype=np.float32) for _ in batch]
+
+    monkeypatch.setattr(refresh_embeddings, "image_embedding_cache", ImageEmbeddingCache(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(ml_service, "load_image", load_image)
+    monkeypatch.setattr(ml_service, "extract_features_batch", extract_features_batch)
+    stats = {"failed": 0, "reused": 0, "inferred": 0}
+
+    rows = embed_batch([(1, b"bad"), (2, b"a"), (3, b"b"), (4, b"bad")], inference_batch_size=1, stats=stats)
+
+    assert [pid for pid, _ in rows] == [2, 3]
+    assert stats == {"failed": 2, "reused": 0, "inferred": 2}
+    assert all(img.closed for img in images)
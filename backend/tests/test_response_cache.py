@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import cache_warmup
+from api import products
+from response_cache import response_cache, MemoryBackend
+from conftest import insert_product
+
+app = FastAPI()
+app.include_router(products.router)
+
+
+@pytest.fixture
+def client(db):
+    response_cache.invalidate()
+    response_cache.catalog_version = None
+    yield TestClient(app)
+    response_cache.invalidate()
+
+
+def refresh() -> bool:
+    async def run():
+        async for session in cache_warmup.get_session():
+            return await cache_warmup.refresh_response_cache(session)
+    return asyncio.run(run())
+
+
+def test_hits_carry_the_etag_and_revalidate_with_304(db, client):
+    insert_product(db, "Shirt")
+    first = client.get("/products/new-arrivals")
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    assert first.headers["Cache-Control"].startswith("public, max-age=")
+
+    second = client.get("/products/new-arrivals")
+    assert second.headers["X-Cache"] == "HIT" and second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+    revalidated = client.get("/products/new-arrivals", headers={"If-None-Match": f'W/{first.headers["ETag"]}'})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    # Different query strings are different entries
+    assert client.get("/products/new-arrivals", params={"limit": 1}).headers["X-Cache"] == "MISS"
+
+
+def test_catalog_changes_invalidate_cached_responses(db, client):
+    insert_product(db, "Shirt")
+    assert refresh()
+    etag = client.get("/products/new-arrivals").headers["ETag"]
+    assert not refresh()
+    assert client.get("/products/new-arrivals").headers["X-Cache"] == "HIT"
+
+    added = insert_product(db, "Dress", created_at="datetime('now', '+1 minute')")
+    assert refresh()
+    response = client.get("/products/new-arrivals", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["X-Cache"] == "MISS"
+    assert response.json()[0]["id"] == added and response.headers["ETag"] != etag
+
+
+def test_memory_backend_expires_entries_after_the_ttl_they_were_set_with():
+    backend = MemoryBackend()
+    backend.set("short", b"a", ttl=-1)
+    backend.set("long", b"b", ttl=60)
+    assert backend.get("short") is None
+    assert backend.get("long") == b"b"
@@ -0,0 +1,79 @@
+import io
+import json
+import asyncio
+from concurrent.futures import Future
+import numpy as np
+from PIL import Image
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import cache_warmup
+from api import search
+from image_embedding_cache import image_embedding_cache, content_digest
+from query_cache import QueryCache, query_cache
+from conftest import insert_product, random_embedding
+
+app = FastAPI()
+app.include_router(search.router)
+
+
+def png(colour) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), colour).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_uploads_stay_in_the_memory_tier(db, fresh_ml, monkeypatch):
+    rng = np.random.default_rng(0)
+    ids = [insert_product(db, f"p{i}", embedding=random_embedding(rng), embedding_model=fresh_ml.model_id)
+           for i in range(5)]
+    assert asyncio.run(cache_warmup.warm_ml_cache())
+    target = json.loads(db.execute("SELECT embedding FROM product WHERE id = ?", (ids[3],)).fetchone()[0])
+
+    calls = []
+
+    def submit_features(img):
+        calls.append(img)
+        future = Future()
+        future.set_result(np.asarray(target, dtype=np.float32) / np.linalg.norm(target))
+        return future
+
+    monkeypatch.setattr(fresh_ml, "submit_features", submit_features)
+    monkeypatch.setattr(fresh_ml, "model_ready", True)
+    query_cache.clear()
+    before = image_embedding_cache.count()
+    client = TestClient(app)
+
+    for _ in range(2):
+        response = client.post("/search/image", files={"file": ("q.png", png((200, 10, 10)), "image/png")})
+        assert response.status_code == 200
+        assert response.json()[0]["id"] == ids[3] and "embedding" not in response.json()[0]
+    # One forward pass (the repeat is a memory hit) and nothing written to the shared store
+    assert len(calls) == 1
+    assert image_embedding_cache.count() == before
+
+
+def test_persistent_tier_hits_are_counted_as_hits(db, fresh_ml, monkeypatch):
+    rng = np.random.default_rng(1)
+    ids = [insert_product(db, f"p{i}", embedding=random_embedding(rng), embedding_model=fresh_ml.model_id)
+           for i in range(5)]
+    assert asyncio.run(cache_warmup.warm_ml_cache())
+    target = np.asarray(json.loads(db.execute("SELECT embedding FROM product WHERE id = ?", (ids[2],)).fetchone()[0]),
+                        dtype=np.float32)
+    upload = png((10, 200, 10))
+    # A catalog image embedded by generate_embeddings, later uploaded by a shopper
+    image_embedding_cache.put(content_digest(upload), fresh_ml.model_id, target / np.linalg.norm(target))
+
+    def submit_features(img):
+        raise AssertionError("the stored embedding should be reused")
+
+    monkeypatch.setattr(fresh_ml, "submit_features", submit_features)
+    monkeypatch.setattr(fresh_ml, "model_ready", True)
+    cache = QueryCache()
+    monkeypatch.setattr(search, "query_cache", cache)
+    client = TestClient(app)
+
+    for _ in range(2):
+        response = client.post("/search/image", files={"file": ("q.png", upload, "image/png")})
+        assert response.status_code == 200 and response.json()[0]["id"] == ids[2]
+    stats = cache.stats()
+    assert (stats["persistent_hits"], stats["hits"], stats["misses"]) == (1, 1, 0) and stats["hit_rate"] == 1.0
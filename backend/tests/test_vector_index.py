@@ -0,0 +1,82 @@
+import copy
+import numpy as np
+import pytest
+from vector_index import ExactIndex, IVFIndex, normalize_rows
+from quantization import create_codec
+
+
+def unit_vectors(rng, n: int, dim: int = 32) -> np.ndarray:
+    return normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def make_index(kind: str, codec: str = "float32"):
+    if kind == "ivf":
+        return IVFIndex(nlist=8, nprobe=8, codec=create_codec(codec))
+    return ExactIndex(codec=create_codec(codec))
+
+
+@pytest.mark.parametrize("kind", ["exact", "ivf"])
+def test_incremental_upserts_match_a_rebuild(kind):
+    rng = np.random.default_rng(0)
+    vectors = unit_vectors(rng, 300)
+    ids = np.arange(1, 301, dtype=np.int64)
+    index = make_index(kind)
+    index.build(ids[:200], vectors[:200])
+    # Delta batches: new products, then re-embedded ones
+    for start in range(200, 300, 7):
+        index.upsert(ids[start:start + 7], vectors[start:start + 7])
+    replaced = unit_vectors(rng, 10)
+    index.upsert(ids[:10], replaced)
+    vectors[:10] = replaced
+
+    rebuilt = make_index(kind)
+    rebuilt.build(ids, vectors)
+    assert len(index) == 300
+    for query in unit_vectors(rng, 5):
+        got_ids, got = index.search(query, 10)
+        want_ids, want = rebuilt.search(query, 10)
+        assert got_ids.tolist() == want_ids.tolist()
+        np.testing.assert_allclose(got, want, rtol=1e-5)
+
+
+def test_append_buffer_leaves_the_built_matrix_and_older_copies_untouched():
+    rng = np.random.default_rng(1)
+    index = ExactIndex()
+    index.build(np.arange(100, dtype=np.int64), unit_vectors(rng, 100))
+    base = index.codes
+    snapshot = copy.copy(index)
+
+    fresh = unit_vectors(rng, 3)
+    for i in range(3):
+        index = copy.copy(index)
+        index.upsert(np.array([1000 + i]), fresh[i:i + 1])
+
+    # The built (memory-mapped) matrix is shared, not re-allocated per delta
+    assert index.codes is base and index.n_tail == 3
+    assert index.search(fresh[2], 1)[0].tolist() == [1002]
+    assert 1002 not in snapshot.search(fresh[2], 100)[0].tolist() and len(snapshot) == 100
+
+
+def test_compaction_folds_the_buffer_in():
+    rng = np.random.default_rng(2)
+    vectors = unit_vectors(rng, 50)
+    index = ExactIndex()
+    index.build(np.arange(50, dtype=np.int64), vectors[:50])
+    index.upsert(np.arange(50, 60, dtype=np.int64), unit_vectors(rng, 10))
+    index.remove(np.arange(0, 20, dtype=np.int64))
+    index.compact()
+
+    assert index.n_tail == 0 and len(index.codes) == len(index) == 40
+    assert index.search(vectors[30], 1)[0].tolist() == [30]
+
+
+def test_filtered_search_reads_appended_rows():
+    rng = np.random.default_rng(3)
+    vectors = unit_vectors(rng, 40)
+    index = make_index("exact", "int8")
+    index.build(np.arange(30, dtype=np.int64), vectors[:30])
+    index.upsert(np.arange(30, 40, dtype=np.int64), vectors[30:])
+    allowed = np.zeros(40, dtype=bool)
+    allowed[[3, 35]] = True
+
+    assert index.search(vectors[35], 2, allowed=allowed)[0].tolist() == [35, 3]
@@ -0,0 +1,106 @@
+import os
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import column, func, literal_column, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import ColumnElement, Select
+from models import Product
+
+# Full-text Search Configuration - Configurable via .env
+# Postgres text search configuration (stemming, stop words) used for product.search_vector
+PG_TEXT_SEARCH_CONFIG = os.getenv("PG_TEXT_SEARCH_CONFIG", "english")
+# At most this many words of a query are matched
+MAX_TERMS = 8
+# Relevance weights of name vs description matches (SQLite bm25; Postgres uses setweight A/B)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+FTS_TABLE = "product_fts"
+SEARCH_VECTOR = "search_vector"
+# False when the local SQLite build lacks FTS5; searches then fall back to ILIKE
+FTS_AVAILABLE = True
+
+_fts = table(FTS_TABLE, column("rowid"), column(FTS_TABLE))
+
+
+def query_terms(search: str) -> List[str]:
+    """Words of a user query, lower-cased; everything else (operators, quotes) is dropped."""
+    return re.findall(r"\w+", search.lower())[:MAX_TERMS]
+
+
+def _migrate_sqlite(conn: Connection):
+    global FTS_AVAILABLE
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                          {"name": FTS_TABLE}).first()
+    if exists:
+        return
+    if not conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        FTS_AVAILABLE = False
+        print("⚠️  SQLite was built without FTS5; product search falls back to ILIKE scans")
+        return
+    print(f"🛠️  Migrating: building FTS5 index {FTS_TABLE} over product name/description")
+    # External-content table: the index references product rows instead of copying them
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, description, content='product', content_rowid='id', "
+        f"tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    insert = f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);"
+    delete = (f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+              f"VALUES ('delete', old.id, old.name, old.description);")
+    conn.execute(text(f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON product BEGIN {insert} END"))
+    conn.execute(text(f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON product BEGIN {delete} END"))
+    conn.execute(text(f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name, description ON product "
+                      f"BEGIN {delete} {insert} END"))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _migrate_postgres(conn: Connection):
+    columns = set(conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = 'product'::regclass AND NOT attisdropped"
+    )).scalars())
+    if SEARCH_VECTOR not in columns:
+        print(f"🛠️  Migrating: adding generated product.{SEARCH_VECTOR} ({PG_TEXT_SEARCH_CONFIG})")
+        # A stored generated column is recomputed by Postgres on every insert/update
+        conn.execute(text(
+            f"ALTER TABLE product ADD COLUMN {SEARCH_VECTOR} tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{PG_TEXT_SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+            f"setweight(to_tsvector('{PG_TEXT_SEARCH_CONFIG}', coalesce(description, '')), 'B')) STORED"
+        ))
+    indexes = set(conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'product'")).scalars())
+    if f"ix_product_{SEARCH_VECTOR}" not in indexes:
+        conn.execute(text(f"CREATE INDEX ix_product_{SEARCH_VECTOR} ON product USING GIN ({SEARCH_VECTOR})"))
+
+
+def migrate(conn: Connection):
+    """Creates and backfills the full-text index for the connected dialect. Idempotent; called from migrations.py."""
+    if conn.dialect.name == "postgresql":
+        _migrate_postgres(conn)
+    elif conn.dialect.name == "sqlite":
+        _migrate_sqlite(conn)
+
+
+def apply(query: Select, search: str, dialect_name: str) -> Tuple[Select, Optional[ColumnElement]]:
+    """
+    Restricts a Product query to rows matching every word of `search`, each
+    as a prefix ("shir" finds "shirts"), through the full-text index.
+    Returns the query and an ORDER BY clause ranking best matches first
+    (None when the query has no words).
+    """
+    terms = query_terms(search)
+    if not terms:
+        return query, None
+    if dialect_name == "postgresql":
+        tsquery = func.to_tsquery(literal_column(f"'{PG_TEXT_SEARCH_CONFIG}'::regconfig"),
+                                  " & ".join(f"{term}:*" for term in terms))
+        vector = literal_column(f"product.{SEARCH_VECTOR}")
+        query = query.where(vector.op("@@")(tsquery))
+        return query, func.ts_rank_cd(vector, tsquery).desc()
+    if dialect_name == "sqlite" and FTS_AVAILABLE:
+        match = " ".join(f'"{term}"*' for term in terms)
+        query = query.join(_fts, _fts.c.rowid == Product.id).where(_fts.c[FTS_TABLE].op("MATCH")(match))
+        # bm25 is lower for better matches
+        return query, func.bm25(literal_column(FTS_TABLE), NAME_WEIGHT, DESCRIPTION_WEIGHT).asc()
+    # No text index: every word must appear in the name or description
+    for term in terms:
+        query = query.where(Product.name.ilike(f"%{term}%") | Product.description.ilike(f"%{term}%"))
+    return query, None
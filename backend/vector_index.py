@@ -0,0 +1,364 @@
+import os
+import time
+import numpy as np
+from numpy.linalg import norm
+from typing import List, Tuple, Optional
+from quantization import Codec, Float32Codec, Int8Codec, create_codec, RERANK
+
+# Index Configuration - Configurable via .env
+# ML_INDEX_TYPE: "exact" (brute-force cosine) or "ivf" (inverted file, approximate)
+INDEX_TYPE = os.getenv("ML_INDEX_TYPE", "exact")
+# Number of k-means cells for IVF. 0 = auto (~4 * sqrt(N))
+IVF_NLIST = int(os.getenv("ML_IVF_NLIST", "0"))
+# Cells scanned per query. Higher = better recall, slower queries.
+IVF_NPROBE = int(os.getenv("ML_IVF_NPROBE", "8"))
+# Catalogs smaller than this are always searched exactly
+IVF_MIN_SIZE = int(os.getenv("ML_IVF_MIN_SIZE", "10000"))
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """L2-normalizes the rows of a float32 matrix (or a single vector)."""
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        return x / (norm(x) + 1e-7)
+    return x / (norm(x, axis=1, keepdims=True) + 1e-7)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, sorted descending, via argpartition."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def spherical_kmeans(x: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0, chunk_size: int = 8192) -> np.ndarray:
+    """
+    K-means on the unit sphere (cosine k-means). Expects L2-normalized rows and
+    returns L2-normalized centroids of shape (n_clusters, D).
+    """
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    n_clusters = min(n_clusters, n)
+    centroids = x[rng.choice(n, n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = assign_to_centroids(x, centroids, chunk_size)
+        counts = np.bincount(assign, minlength=n_clusters)
+        order = np.argsort(assign, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        non_empty = counts > 0
+        sums[non_empty] = np.add.reduceat(x[order], starts[non_empty], axis=0)
+
+        # Re-seed empty cells with random points so no centroid is wasted
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = x[rng.choice(n, len(empty), replace=False)]
+
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+def assign_to_centroids(x: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Nearest centroid (max inner product) for each row, computed in chunks."""
+    assign = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], chunk_size):
+        block = x[start:start + chunk_size] @ centroids.T
+        assign[start:start + chunk_size] = block.argmax(axis=1)
+    return assign
+
+
+class VectorIndex:
+    """
+    Base class for similarity indexes over L2-normalized float32 vectors.
+    Vectors are held as `codec` codes; with `rerank` > 0 the full-precision
+    vectors are also kept and used to re-score the top `rerank` candidates.
+    search() returns (ids, cosine similarities) sorted by descending similarity.
+    An optional boolean `allowed` mask over the rows (see attribute_filter)
+    restricts the search to matching products before any scoring.
+
+    upsert()/remove() apply incremental changes: removed rows are tombstoned
+    in `alive` and new rows appended, and the index compacts itself once
+    enough rows are dead. Appended rows go to a growable buffer after the
+    built (possibly memory-mapped) `codes`, so a delta costs O(batch) and
+    never copies the catalog. Mutations replace arrays, or write the buffer
+    only past the rows that existing copies see, so a shallow copy of the
+    latest index can be updated while the original keeps serving searches.
+    """
+    name = "base"
+    # Fraction of tombstoned rows that triggers a compaction
+    compact_ratio = 0.2
+
+    def __init__(self, codec: Optional[Codec] = None, rerank: int = RERANK):
+        self.codec = codec or Float32Codec()
+        self.rerank = rerank
+        self.ids = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, 0), dtype=np.float32)
+        self.vectors: Optional[np.ndarray] = None
+        self.alive = np.empty(0, dtype=bool)
+        self.n_dead = 0
+        # Append buffer: rows len(codes) .. len(ids) - 1 live in its first n_tail rows
+        self.tail_codes: Optional[np.ndarray] = None
+        self.tail_vectors: Optional[np.ndarray] = None
+        self.n_tail = 0
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.n_dead
+
+    @property
+    def dim(self) -> int:
+        return self.codec.dim
+
+    def memory_bytes(self) -> int:
+        total = self.codes.nbytes + self.ids.nbytes
+        for array in (self.vectors, self.tail_codes, self.tail_vectors):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+    def _reset_tail(self):
+        self.tail_codes = self.tail_vectors = None
+        self.n_tail = 0
+
+    def _gather(self, base: np.ndarray, tail: Optional[np.ndarray], rows: np.ndarray) -> np.ndarray:
+        """Rows of `base` continued by the append buffer `tail`, in the order of `rows`."""
+        n_base = len(base)
+        in_tail = rows >= n_base
+        if not self.n_tail or not in_tail.any():
+            return base[rows]
+        out = np.empty((len(rows),) + tail.shape[1:], dtype=tail.dtype)
+        out[~in_tail] = base[rows[~in_tail]]
+        out[in_tail] = tail[rows[in_tail] - n_base]
+        return out
+
+    def _score_all(self, query: np.ndarray) -> np.ndarray:
+        similarities = self.codec.score(query, self.codes)
+        if self.n_tail:
+            similarities = np.concatenate([similarities, self.codec.score(query, self.tail_codes[:self.n_tail])])
+        return similarities
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        if 0 < len(vectors) < self.codec.min_train:
+            # E.g. the first delta batch into an empty index; the next full rebuild trains the configured codec
+            print(f"⚠️  {len(vectors)} vectors are too few to train the {self.codec.name} codec "
+                  f"(minimum {self.codec.min_train}). Storing them as int8.")
+            self.codec = Int8Codec()
+        if len(vectors):
+            self.codec.fit(vectors)
+        self.codes = self.codec.encode(vectors)
+        # Full-precision copy only matters when it differs from the codes
+        keep_full = self.rerank > 0 and not isinstance(self.codec, Float32Codec)
+        self.vectors = vectors if keep_full else None
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.n_dead = 0
+        self._reset_tail()
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray):
+        """Adds new products and replaces the vectors of existing ones."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(ids) == 0:
+            return
+        if len(self.ids) == 0:
+            self.build(ids, vectors)
+            return
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+        self.remove(ids)
+        self._append(ids, vectors)
+        if self.n_dead > self.compact_ratio * len(self.ids):
+            self.compact()
+
+    def remove(self, ids: np.ndarray) -> int:
+        """Tombstones the given product ids. Returns how many were live."""
+        dead = np.isin(self.ids, np.asarray(ids, dtype=np.int64)) & self.alive
+        removed = int(dead.sum())
+        if removed:
+            self.alive = self.alive & ~dead
+            self.n_dead += removed
+        return removed
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray):
+        # ids/alive are 9 bytes a row and simply re-allocated; codes and vectors go to the buffer
+        self.ids = np.concatenate([self.ids, ids])
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self.tail_codes = _buffer_append(self.tail_codes, self.n_tail, self.codec.encode(vectors))
+        if self.vectors is not None:
+            self.tail_vectors = _buffer_append(self.tail_vectors, self.n_tail, vectors)
+        self.n_tail += len(ids)
+
+    def compact(self):
+        """Drops tombstoned rows and folds the append buffer in. Codebooks/centroids are kept as trained."""
+        keep = self.alive
+        rows = np.flatnonzero(keep)
+        self.codes = self._gather(self.codes, self.tail_codes, rows)
+        if self.vectors is not None:
+            self.vectors = self._gather(self.vectors, self.tail_vectors, rows)
+        self.ids = self.ids[keep]
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.n_dead = 0
+        self._reset_tail()
+
+    def _rank(self, query: np.ndarray, rows: np.ndarray, similarities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k over candidate rows, optionally re-scored with exact vectors."""
+        if self.n_dead:
+            live = self.alive[rows]
+            rows, similarities = rows[live], similarities[live]
+        if self.vectors is not None:
+            candidates = rows[top_k_indices(similarities, max(k, self.rerank))]
+            similarities = self._gather(self.vectors, self.tail_vectors, candidates) @ query
+            rows = candidates
+        top = top_k_indices(similarities, k)
+        return self.ids[rows[top]], similarities[top]
+
+    def search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force cosine search: one mat-vec product + argpartition."""
+    name = "exact"
+
+    def search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if allowed is not None:
+            # Only matching rows are scored; cost scales with the filter's selectivity
+            rows = np.flatnonzero(allowed)
+            return self._rank(query, rows, self.codec.score(query, self._gather(self.codes, self.tail_codes, rows)), k)
+        return self._rank(query, np.arange(len(self.ids)), self._score_all(query), k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index: a spherical k-means coarse quantizer partitions the
+    catalog into `nlist` cells, and a query only scans the `nprobe` cells whose
+    centroids are closest to it. nprobe is the recall/latency knob.
+    Incremental upserts are assigned to the existing cells without retraining.
+    """
+    name = "ivf"
+
+    def __init__(self, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE, train_size: int = 100_000,
+                 codec: Optional[Codec] = None, rerank: int = RERANK):
+        super().__init__(codec, rerank)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.assign = np.empty(0, dtype=np.int64)
+        self.lists: List[np.ndarray] = []
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        super().build(ids, vectors)
+        n = len(self.ids)
+        if n == 0:
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.assign = np.empty(0, dtype=np.int64)
+            self.lists = []
+            return
+
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        start = time.perf_counter()
+        rng = np.random.default_rng(0)
+        if n > self.train_size:
+            train = vectors[rng.choice(n, self.train_size, replace=False)]
+        else:
+            train = vectors
+        self.centroids = spherical_kmeans(train, nlist)
+
+        self.assign = assign_to_centroids(vectors, self.centroids)
+        self._rebuild_lists()
+        print(f"🧭 IVF index built: {n} vectors, {len(self.centroids)} cells in {time.perf_counter() - start:.1f}s")
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assign, kind='stable')
+        bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray):
+        first_row = len(self.ids)
+        super()._append(ids, vectors)
+        new_assign = assign_to_centroids(vectors, self.centroids)
+        self.assign = np.concatenate([self.assign, new_assign])
+        lists = list(self.lists)
+        for offset, cell in enumerate(new_assign.tolist()):
+            lists[cell] = np.append(lists[cell], first_row + offset)
+        self.lists = lists
+
+    def compact(self):
+        keep = self.alive
+        self.assign = self.assign[keep]
+        super().compact()
+        self._rebuild_lists()
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        rows = np.concatenate([self.lists[c] for c in probe])
+        if allowed is not None:
+            matching = np.flatnonzero(allowed)
+            probed = rows[allowed[rows]]
+            # Selective filters: scoring every match is cheaper than probing, or the
+            # probed cells hold fewer than k matches. Either way search the matches exactly.
+            rows = matching if len(matching) <= len(rows) or len(probed) < k else probed
+
+        similarities = self.codec.score(query, self._gather(self.codes, self.tail_codes, rows))
+        return self._rank(query, rows, similarities, k)
+
+
+def _buffer_append(buffer: Optional[np.ndarray], used: int, rows: np.ndarray) -> np.ndarray:
+    """
+    Writes `rows` after the first `used` rows of a growable buffer, doubling
+    it when full. Rows before `used` are never written, so index copies that
+    still reference the buffer keep seeing their own rows.
+    """
+    needed = used + len(rows)
+    if buffer is None or needed > len(buffer):
+        grown = np.empty((max(needed, 2 * (len(buffer) if buffer is not None else 0), 64),) + rows.shape[1:],
+                         dtype=rows.dtype)
+        if used:
+            grown[:used] = buffer[:used]
+        buffer = grown
+    buffer[used:needed] = rows
+    return buffer
+
+
+def create_index(n_vectors: int, index_type: str = INDEX_TYPE, codec_name: Optional[str] = None) -> VectorIndex:
+    """
+    Picks the configured index type and storage codec, falling back to exact
+    search for small catalogs.
+    """
+    codec = create_codec(codec_name) if codec_name else create_codec()
+    if index_type == "ivf" and n_vectors >= IVF_MIN_SIZE:
+        return IVFIndex(codec=codec)
+    return ExactIndex(codec=codec)
+
+
+def recall_at_k(index: VectorIndex, exact: VectorIndex, queries: np.ndarray, k: int = 24) -> float:
+    """
+    Fraction of the exact top-k neighbours that the index also returns,
+    averaged over the query set.
+    """
+    hits = 0
+    total = 0
+    for q in queries:
+        truth = set(exact.search(q, k)[0].tolist())
+        found = set(index.search(q, k)[0].tolist())
+        hits += len(truth & found)
+        total += len(truth)
+    return hits / total if total else 1.0
@@ -114,7 +114,7 @@ function ShopContent() {
         }
     }, [inView, hasNextPage, isFetchingNextPage, fetchNextPage]);
 
-    const products = data?.pages.flatMap(page => page) || [];
+    const products = data?.pages.flatMap(page => page.products) || [];
 
     return (
         <main className="min-h-screen bg-slate-950 text-white selection:bg-first-color/30">
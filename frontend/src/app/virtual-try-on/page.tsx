@@ -34,7 +34,7 @@ function VirtualTryOnContent() {
     const [searchQuery, setSearchQuery] = useState("");
 
     const { data: productsData, isLoading: loadingProducts } = useInfiniteProducts({ search: searchQuery });
-    const allProducts = productsData?.pages.flatMap(page => page) || [];
+    const allProducts = productsData?.pages.flatMap(page => page.products) || [];
 
     // Auto-select product from URL if present
     useEffect(() => {
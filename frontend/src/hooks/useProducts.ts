@@ -34,11 +34,16 @@ export interface ProductFilters {
     search?: string;
 }
 
+export interface ProductPage {
+    products: Product[];
+    nextCursor: string | null;
+}
+
 export const useInfiniteProducts = (filters?: ProductFilters) => {
     return useInfiniteQuery({
         queryKey: ["products", filters],
-        initialPageParam: 0,
-        queryFn: async ({ pageParam = 0 }) => {
+        initialPageParam: null as string | null,
+        queryFn: async ({ pageParam }): Promise<ProductPage> => {
             const params = new URLSearchParams();
             if (filters?.category_id) params.append("category_id", filters.category_id.toString());
             if (filters?.gender) params.append("gender", filters.gender);
@@ -49,17 +54,14 @@ export const useInfiniteProducts = (filters?: ProductFilters) => {
             if (filters?.order) params.append("order", filters.order);
             if (filters?.search) params.append("search", filters.search);
 
-            // Pagination
+            // Cursor pagination: the API returns the next page's cursor in a header
             params.append("limit", "50");
-            params.append("offset", (pageParam * 50).toString());
+            if (pageParam) params.append("cursor", pageParam);
 
-            const { data } = await api.get<Product[]>("/products", { params });
-            return data;
-        },
-        getNextPageParam: (lastPage, allPages) => {
-            if (!lastPage || lastPage.length === 0) return undefined;
-            return lastPage.length === 50 ? allPages.length : undefined;
+            const { data, headers } = await api.get<Product[]>("/products", { params });
+            return { products: data, nextCursor: headers["x-next-cursor"] ?? null };
         },
+        getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
     });
 };
 